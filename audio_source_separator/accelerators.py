@@ -0,0 +1,354 @@
+"""
+Helpers that speed up inference of the PyTorch models used by the audio separators,
+such as compiling the Demucs networks into fused kernels.
+"""
+
+import hashlib
+import itertools
+import json
+import logging
+from typing import Optional
+import torch
+from torch import nn
+
+logger = logging.getLogger(__name__)
+
+# Name of the file, stored alongside a saved TorchScript module, recording the
+# chunk shape the module was traced with
+_CHUNK_SHAPE_FILE = "chunk_shape.json"
+
+
+def iter_demucs_networks(model: nn.Module) -> list[nn.Module]:
+    """
+    Lists the individual networks contained in a Demucs model.
+
+    `demucs.apply.apply_model` recurses into a `BagOfModels` and calls each of its
+    networks directly, so any forward wrapper must be attached to those networks
+    rather than to the bag itself.
+
+    Args:
+        model: A Demucs model, either a single network or a bag of networks.
+
+    Returns:
+        The list of networks that are actually invoked during separation.
+    """
+    from demucs.apply import BagOfModels
+
+    if isinstance(model, BagOfModels):
+        return list(model.models)
+    return [model]
+
+
+def compile_demucs_model(model: nn.Module, mode: str = "reduce-overhead") -> None:
+    """
+    Compiles the forward pass of every Demucs network with `torch.compile`.
+
+    The bound `forward` is replaced in place, so the module types checked by
+    `apply_model` (e.g. `HTDemucs`) are preserved. `apply_model` already pads every
+    chunk to the model's training segment, so the compiled graph sees a single
+    static shape: it is compiled with `dynamic=False`, so it is specialized to that
+    shape instead of being recompiled with symbolic sizes, and in
+    "reduce-overhead" mode it is replayed as a CUDA graph. Networks that were
+    already compiled are left untouched.
+
+    Args:
+        model: The Demucs model to compile.
+        mode: The `torch.compile` mode to use.
+    """
+    for network in iter_demucs_networks(model):
+        if getattr(network, "_is_compiled", False):
+            continue
+        network.forward = torch.compile(
+            network.forward, mode=mode, fullgraph=False, dynamic=False
+        )
+        network._is_compiled = True
+        logger.info("Compiled %s forward (mode: %s)", type(network).__name__, mode)
+
+
+def cast_demucs_weights(model: nn.Module, dtype: torch.dtype) -> None:
+    """
+    Casts the weights of every Demucs network to a reduced-precision dtype, in place.
+
+    This halves the weight memory and bandwidth, and spares autocast from casting
+    the FP32 weights on every forward pass. The networks must then run under
+    autocast with the same dtype, which also upcasts the weights of the ops that
+    need FP32, such as the normalization layers.
+
+    Args:
+        model: The Demucs model whose weights should be cast.
+        dtype: The dtype to cast the weights to, torch.float16 or torch.bfloat16.
+    """
+    for network in iter_demucs_networks(model):
+        network.to(dtype=dtype)
+        logger.info("Cast %s weights to %s", type(network).__name__, dtype)
+
+
+class CUDAGraphedForward:
+    """
+    Replays a network's forward pass from CUDA graphs captured once per input shape.
+
+    At batch size 1 the Demucs forward pass launches thousands of small kernels per
+    chunk, so the GPU mostly sits idle waiting on Python. The first call with a
+    given input shape warms the network up eagerly on a side stream and captures
+    one full forward into a graph; later calls copy the chunk into the static input
+    buffer and replay the graph. Non-CUDA inputs fall back to the eager forward.
+
+    The graphs are bound to the addresses of the network's weights, so they are
+    dropped and captured again whenever those addresses change, e.g. if the
+    network was moved off the GPU and back, and the eager forward is used while
+    any weight is not on CUDA.
+    """
+
+    def __init__(self, forward, network: nn.Module, warmup_iterations: int = 3):
+        self._forward = forward
+        self._network = network
+        self._warmup_iterations = warmup_iterations
+        self._pool = None
+        self._weight_pointers: Optional[tuple[int, ...]] = None
+        self._graphs: dict[
+            tuple, tuple[torch.cuda.CUDAGraph, torch.Tensor, torch.Tensor]
+        ] = {}
+
+    def __call__(self, mix: torch.Tensor) -> torch.Tensor:
+        if not mix.is_cuda:
+            return self._forward(mix)
+
+        weights = list(
+            itertools.chain(self._network.parameters(), self._network.buffers())
+        )
+        if not all(weight.is_cuda for weight in weights):
+            return self._forward(mix)
+        weight_pointers = tuple(weight.data_ptr() for weight in weights)
+        if weight_pointers != self._weight_pointers:
+            if self._graphs:
+                logger.warning("Model weights moved; capturing new CUDA graphs")
+            self._graphs.clear()
+            self._weight_pointers = weight_pointers
+
+        graph_key = (tuple(mix.shape), mix.dtype, torch.is_autocast_enabled())
+        captured = self._graphs.get(graph_key)
+        if captured is None:
+            captured = self._capture(mix)
+            self._graphs[graph_key] = captured
+
+        graph, static_input, static_output = captured
+        static_input.copy_(mix)
+        graph.replay()
+        return static_output.clone()
+
+    def _capture(
+        self, mix: torch.Tensor
+    ) -> tuple[torch.cuda.CUDAGraph, torch.Tensor, torch.Tensor]:
+        """Warms up the forward pass and captures it for the shape of `mix`."""
+        static_input = mix.clone()
+
+        side_stream = torch.cuda.Stream()
+        side_stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(side_stream):
+            for _ in range(self._warmup_iterations):
+                self._forward(static_input)
+        torch.cuda.current_stream().wait_stream(side_stream)
+
+        if self._pool is None:
+            self._pool = torch.cuda.graph_pool_handle()
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph, pool=self._pool):
+            static_output = self._forward(static_input)
+        logger.info("Captured CUDA graph for input shape %s", tuple(mix.shape))
+        return graph, static_input, static_output
+
+
+def capture_demucs_cuda_graphs(model: nn.Module) -> bool:
+    """
+    Wraps the forward pass of every Demucs network in a `CUDAGraphedForward`.
+
+    A captured graph replays kernels bound to the addresses of the weights, so
+    the networks must stay resident on the GPU: if any of their weights is not
+    on CUDA, e.g. because `apply_model` would move them there only for the
+    duration of a call, no network is wrapped. Networks that are already wrapped
+    are left untouched.
+
+    Args:
+        model: The Demucs model whose networks should replay CUDA graphs.
+
+    Returns:
+        True if the networks replay CUDA graphs, False otherwise.
+    """
+    networks = iter_demucs_networks(model)
+    if not all(
+        tensor.is_cuda
+        for network in networks
+        for tensor in itertools.chain(network.parameters(), network.buffers())
+    ):
+        logger.warning(
+            "CUDA graphs require the model weights to be resident on the GPU; "
+            "skipping graph capture"
+        )
+        return False
+
+    for network in networks:
+        if isinstance(network.forward, CUDAGraphedForward):
+            continue
+        network.forward = CUDAGraphedForward(network.forward, network)
+    return True
+
+
+def quantize_demucs_model(model: nn.Module) -> None:
+    """
+    Quantizes the weights of the Demucs Linear and LSTM layers to INT8, in place.
+
+    At batch size 1 inference is bound by weight memory traffic, which INT8
+    weights cut by 4x. Dynamic quantization only has CPU kernels (FBGEMM on x86,
+    QNNPACK on ARM), so the quantized model must run on the CPU. The convolutions
+    are left in floating point: Demucs has no conv/batch-norm pairs to fuse, and
+    static quantization cannot go through its complex spectrogram branch.
+
+    Args:
+        model: The Demucs model to quantize.
+    """
+    for network in iter_demucs_networks(model):
+        torch.ao.quantization.quantize_dynamic(
+            network, {nn.Linear, nn.LSTM}, dtype=torch.qint8, inplace=True
+        )
+        logger.info("Quantized %s Linear/LSTM weights to INT8", type(network).__name__)
+
+
+class TorchScriptForward:
+    """
+    Runs a network's forward pass through a frozen TorchScript module.
+
+    A traced module is specialized to the chunk shape it was traced with, so any
+    other input falls back to the eager forward. Scripted modules accept any shape.
+    """
+
+    def __init__(
+        self,
+        forward,
+        script_module: torch.jit.ScriptModule,
+        chunk_shape: Optional[tuple[int, int, int]] = None,
+    ):
+        self._forward = forward
+        self._script_module = script_module
+        self._chunk_shape = chunk_shape
+
+    def __call__(self, mix: torch.Tensor) -> torch.Tensor:
+        if self._chunk_shape is not None and tuple(mix.shape) != self._chunk_shape:
+            return self._forward(mix)
+        return self._script_module(mix)
+
+
+def _convert_to_torchscript(
+    network: nn.Module,
+) -> tuple[torch.jit.ScriptModule, Optional[tuple[int, int, int]]]:
+    """
+    Scripts a Demucs network, tracing it on a dummy chunk if it cannot be scripted.
+
+    The dummy chunk is created on the device, and with the dtype, of the
+    network's weights.
+
+    Args:
+        network: The Demucs network to convert.
+
+    Returns:
+        The frozen TorchScript module, and the chunk shape it was traced with, or
+        None if it was scripted.
+
+    Raises:
+        RuntimeError: If the network can be neither scripted nor traced.
+        ValueError: If the network cannot be scripted and has no fixed chunk shape.
+    """
+    from audio_source_separator.onnx_backends import get_chunk_shape
+
+    network.eval()
+    try:
+        script_module, chunk_shape = torch.jit.script(network), None
+    except Exception as e:  # TorchScript raises several unrelated types
+        logger.info(
+            "Could not script %s, tracing it instead: %s", type(network).__name__, e
+        )
+        chunk_shape = get_chunk_shape(network)
+        weight = next(network.parameters())
+        dummy_chunk = torch.zeros(chunk_shape, device=weight.device, dtype=weight.dtype)
+        with torch.no_grad():
+            script_module = torch.jit.trace(network, dummy_chunk, check_trace=False)
+    return torch.jit.freeze(script_module.eval()), chunk_shape
+
+
+def get_weights_signature(network: nn.Module) -> str:
+    """
+    Hashes the parameters and buffers of a network, so that files derived from its
+    weights can be told apart from those of other checkpoints.
+
+    Args:
+        network: The network to hash.
+
+    Returns:
+        The first 16 hex digits of the SHA-256 of the network's named tensors.
+    """
+    digest = hashlib.sha256()
+    with torch.no_grad():
+        for name, tensor in itertools.chain(
+            network.named_parameters(), network.named_buffers()
+        ):
+            digest.update(name.encode())
+            digest.update(str(tensor.dtype).encode())
+            data = tensor.detach().cpu().contiguous().reshape(-1)
+            digest.update(data.view(torch.uint8).numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+def use_torchscript_backend(model: nn.Module, cache_key: str, device: str) -> bool:
+    """
+    Replaces the forward pass of every Demucs network with a frozen TorchScript
+    module, which runs the fused IR instead of dispatching op by op from Python.
+
+    The TorchScript modules are saved to disk, keyed by (cache_key, network index,
+    device, weight dtype, weights signature, torch version), so the conversion
+    only happens the first time, and updated weights or a torch upgrade never load
+    a stale module. The networks must already be on the device. If any network cannot be converted,
+    the networks keep their eager forward pass.
+
+    Args:
+        model: The Demucs model to convert.
+        cache_key: The name the converted modules are cached under, e.g. the
+            Demucs model name.
+        device: The device the model runs on.
+
+    Returns:
+        True if the TorchScript backend is in use, False otherwise.
+    """
+    from audio_source_separator.onnx_backends import get_backend_cache_dir
+
+    cache_dir = get_backend_cache_dir("torchscript")
+    script_forwards = []
+    try:
+        for index, network in enumerate(iter_demucs_networks(model)):
+            weight_dtype = str(next(network.parameters()).dtype).removeprefix("torch.")
+            script_path = cache_dir / (
+                f"{cache_key}-{index}-{device}-{weight_dtype}-"
+                f"{get_weights_signature(network)}-torch{torch.__version__}.pt"
+            )
+            extra_files = {_CHUNK_SHAPE_FILE: ""}
+            if script_path.exists():
+                script_module = torch.jit.load(
+                    str(script_path), map_location=device, _extra_files=extra_files
+                )
+                chunk_shape = json.loads(extra_files[_CHUNK_SHAPE_FILE] or "null")
+                chunk_shape = tuple(chunk_shape) if chunk_shape else None
+            else:
+                script_module, chunk_shape = _convert_to_torchscript(network)
+                extra_files[_CHUNK_SHAPE_FILE] = json.dumps(chunk_shape)
+                torch.jit.save(
+                    script_module, str(script_path), _extra_files=extra_files
+                )
+            script_forwards.append(
+                TorchScriptForward(network.forward, script_module, chunk_shape)
+            )
+    except (RuntimeError, ValueError) as e:
+        logger.warning("TorchScript backend unavailable, using eager PyTorch: %s", e)
+        return False
+
+    for network, script_forward in zip(iter_demucs_networks(model), script_forwards):
+        network.forward = script_forward
+    logger.info("Using TorchScript modules from %s", cache_dir)
+    return True
@@ -3,18 +3,45 @@ Defines the abstract base class for audio separators and concrete implementation
 for Spleeter and Demucs, along with their Pydantic configuration models.
 """
 
+from __future__ import annotations
+
 import os
+import contextlib
+import functools
+import importlib.metadata
 import logging
+import multiprocessing
+import re
+import struct
+import subprocess
+import threading
+import wave
 from abc import ABC, abstractmethod
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
+from types import MappingProxyType
 from enum import StrEnum
+from typing import TYPE_CHECKING, Literal, Optional, Union
 from pydantic import BaseModel
-import torch
-from demucs.api import Separator as DemucsSeparator
-from demucs.audio import save_audio
+
+# torch and the separation libraries take seconds to import, so they are only
+# imported by the code paths of the selected tool
+if TYPE_CHECKING:
+    import torch
+    from demucs.api import Separator as DemucsSeparator
 
 logger = logging.getLogger(__name__)
 
+# Size of the write buffer used for the stem files
+_STEM_WRITE_BUFFER_SIZE = 1 << 20
+
+# Number of frames decoded at a time when streaming an input file
+_DECODE_BLOCK_FRAMES = 1 << 16
+
+# Length of the noise separated to warm up compiled or graph-captured models
+_WARM_UP_SECONDS = 10
+
 
 class SeparationTool(StrEnum):
     """Enumeration of available audio separation tools."""
@@ -34,12 +61,36 @@ class SpleeterConfig(AudioSeparatorConfig):
     """Configuration specific to Spleeter."""
 
     model_name: str = "spleeter:5stems"
+    max_workers: Optional[int] = None
+    # Experimental: the global Keras policy also applies to Spleeter's FP32 mask
+    # post-processing, whose exponentiation can overflow in FP16
+    mixed_precision: bool = False
+    # Experimental: each distinct track length may recompile the auto-jit
+    # clusters, which can make one-file-at-a-time runs slower
+    xla: bool = False
 
 
 class DemucsConfig(AudioSeparatorConfig):
     """Configuration specific to Demucs."""
 
     model_name: str = "htdemucs"
+    tf32: bool = True
+    precision: Literal["auto", "fp32", "fp16", "bf16"] = "auto"
+    compile_model: bool = False
+    compile_mode: str = "reduce-overhead"
+    cuda_graphs: bool = False
+    shifts: int = 1
+    overlap: float = 0.25
+    segment: Optional[float] = None
+    batch_size: int = 4
+    cpu_quantize: bool = True
+    backend: Literal["torch", "torchscript", "tensorrt", "onnxruntime"] = "torch"
+    prefetch_weights: bool = True
+    empty_cache_every: int = 8
+    num_threads: Optional[int] = None
+    half_weights: bool = False
+    stem_format: Literal["wav", "flac", "mp3"] = "flac"
+    stem_bitrate: int = 320
 
 
 # --- Abstract Base Class for Audio Separators ---
@@ -53,7 +104,8 @@ class AudioSeparator(ABC):
 
     def _check_input_file(self, input_audio_path: str) -> bool:
         """
-        Checks if the specified input audio file exists on the filesystem.
+        Checks if the specified input audio file exists on the filesystem, with a
+        single stat.
 
         Args:
             input_audio_path: The path to the audio file to check.
@@ -61,19 +113,78 @@ class AudioSeparator(ABC):
         Returns:
             True if the file exists, False otherwise.
         """
-        if not os.path.exists(input_audio_path):
-            logger.error(f"Input audio file not found at {input_audio_path}")
+        if not Path(input_audio_path).is_file():
+            logger.error("Input audio file not found at %s", input_audio_path)
             return False
         return True
 
+    def _check_input_files(self, input_audio_paths: list[str]) -> list[str]:
+        """
+        Checks which of the specified input audio files exist on the filesystem.
+
+        Each path is checked with its own stat, as by `_check_input_file`, so that
+        the filesystem resolves it: names on case-insensitive filesystems, trailing
+        separators and directories named like audio files are handled as the
+        decoder would see them.
+
+        Args:
+            input_audio_paths: The paths to the audio files to check.
+
+        Returns:
+            The paths of the files that exist, in their original order.
+        """
+        return [p for p in input_audio_paths if self._check_input_file(p)]
+
+    def warm_up(self) -> None:
+        """
+        Loads the underlying model ahead of the first separation.
+        Subclasses with a model cache should override this method.
+        """
+        pass
+
     @abstractmethod
-    def separate(self, input_audio_path: str, output_audio_folder: str) -> None:
+    def separate(self, input_audio_path: str, output_audio_folder: str) -> bool:
         """
         Performs the audio separation.
         Subclasses must implement this method, interpreting output_audio_folder appropriately.
+
+        Returns:
+            True if the file was separated, False if it was missing or the
+            separation failed, which is logged.
         """
         pass
 
+    def separate_many(
+        self, input_audio_paths: list[str], output_audio_folder: str
+    ) -> list[str]:
+        """
+        Performs the audio separation of several files into output_audio_folder.
+        Subclasses may override this method to process the files more efficiently
+        than one by one. A file that fails does not stop the others.
+
+        Returns:
+            The paths of the files that were missing or could not be separated.
+        """
+        return [
+            input_audio_path
+            for input_audio_path in input_audio_paths
+            if not self.separate(input_audio_path, output_audio_folder)
+        ]
+
+    def separate_batch(
+        self, input_audio_paths: list[str], output_audio_folder: str
+    ) -> list[str]:
+        """
+        Performs the audio separation of several files, running the model on
+        batches of songs. Subclasses whose model accepts batched inputs should
+        override this method; by default the files are separated as by
+        `separate_many`.
+
+        Returns:
+            The paths of the files that were missing or could not be separated.
+        """
+        return self.separate_many(input_audio_paths, output_audio_folder)
+
 
 # --- Spleeter Specific Implementation ---
 class SpleeterAudioSeparator(AudioSeparator):
@@ -82,26 +193,114 @@ class SpleeterAudioSeparator(AudioSeparator):
     def __init__(self, config: SpleeterConfig):
         super().__init__(config)
 
-    def separate(self, input_audio_path: str, output_audio_folder: str) -> None:
+    def warm_up(self) -> None:
+        """Loads the Spleeter model into the separator cache."""
+        _load_spleeter_separator(
+            self.config.model_name, self.config.mixed_precision, self.config.xla
+        )
+
+    def separate(self, input_audio_path: str, output_audio_folder: str) -> bool:
         """Separates an audio file using Spleeter."""
-        logger.info(f"--- Using Spleeter (model: {self.config.model_name}) ---")
+        logger.info("--- Using Spleeter (model: %s) ---", self.config.model_name)
         if not self._check_input_file(input_audio_path):
-            return
+            return False
+
+        Path(output_audio_folder).mkdir(parents=True, exist_ok=True)
+
+        try:
+            spleeter_instance = _load_spleeter_separator(
+                self.config.model_name, self.config.mixed_precision, self.config.xla
+            )
+            logger.info(
+                "Processing %s with Spleeter model %s...",
+                input_audio_path,
+                self.config.model_name,
+            )
+            spleeter_instance.separate_to_file(input_audio_path, output_audio_folder)
+        # Spleeter surfaces TensorFlow and ffmpeg failures with their own types
+        except Exception as e:
+            logger.exception("Error during Spleeter processing: %s", e)
+            return False
+
+        logger.info(
+            "Spleeter separation complete. Output files are in %s", output_audio_folder
+        )
+        return True
+
+    def separate_many(
+        self, input_audio_paths: list[str], output_audio_folder: str
+    ) -> list[str]:
+        """
+        Separates several audio files in parallel worker processes.
 
-        if not os.path.exists(output_audio_folder):
-            os.makedirs(output_audio_folder)
-            logger.info(f"Created output directory: {output_audio_folder}")
+        Spleeter runs on the CPU and every song is independent, so the files are
+        distributed over a process pool (TensorFlow graph execution holds the GIL,
+        which rules out threads). Each worker builds its own Spleeter separator
+        once, in the pool initializer, instead of receiving a pickled model.
+        The pool defaults to half of the available CPUs. A file whose worker fails,
+        including a worker that crashes or cannot load the model, is logged and
+        reported as failed.
 
-        from spleeter.separator import Separator as SpleeterLibSeparator
+        Returns:
+            The paths of the files that were missing or could not be separated.
+        """
+        logger.info("--- Using Spleeter (model: %s) ---", self.config.model_name)
+        existing_paths = self._check_input_files(input_audio_paths)
+        failed_paths = [p for p in input_audio_paths if p not in existing_paths]
+        input_audio_paths = existing_paths
+        if not input_audio_paths:
+            return failed_paths
+
+        Path(output_audio_folder).mkdir(parents=True, exist_ok=True)
 
-        spleeter_instance = SpleeterLibSeparator(self.config.model_name)
+        max_workers = self.config.max_workers or max(1, (os.cpu_count() or 2) // 2)
+        max_workers = min(max_workers, len(input_audio_paths))
         logger.info(
-            f"Processing {input_audio_path} with Spleeter model {self.config.model_name}..."
+            "Processing %s files with %s Spleeter workers...",
+            len(input_audio_paths),
+            max_workers,
         )
-        spleeter_instance.separate_to_file(input_audio_path, output_audio_folder)
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_spleeter_worker,
+            initargs=(
+                self.config.model_name,
+                self.config.mixed_precision,
+                self.config.xla,
+            ),
+        ) as executor:
+            pending_separations = [
+                executor.submit(
+                    _separate_in_spleeter_worker, input_audio_path, output_audio_folder
+                )
+                for input_audio_path in input_audio_paths
+            ]
+            for input_audio_path, pending_separation in zip(
+                input_audio_paths, pending_separations
+            ):
+                try:
+                    if pending_separation.result():
+                        continue
+                except BrokenProcessPool as e:
+                    # A worker died, or its initializer failed to load the model
+                    logger.error(
+                        "Spleeter worker pool failed while processing %s: %s",
+                        input_audio_path,
+                        e,
+                    )
+                # Errors the worker could not catch, such as unpicklable results
+                except Exception as e:
+                    logger.exception(
+                        "Error during Spleeter processing of %s: %s",
+                        input_audio_path,
+                        e,
+                    )
+                failed_paths.append(input_audio_path)
         logger.info(
-            f"Spleeter separation complete. Output files are in {output_audio_folder}"
+            "Spleeter separation complete. Output files are in %s", output_audio_folder
         )
+        return failed_paths
 
 
 # --- Demucs Specific Implementation ---
@@ -110,56 +309,1339 @@ class DemucsAudioSeparator(AudioSeparator):
 
     def __init__(self, config: DemucsConfig):
         super().__init__(config)
+        # Keeps the caching allocator from fragmenting; only effective if set
+        # before CUDA is initialized
+        os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", _get_cuda_alloc_conf())
+        self._files_since_empty_cache = 0
+        self._download_stream = None
+        self._segment = config.segment
+
+        # Downloads the weights while the caller gets ready to separate
+        self._prefetch_thread = None
+        if config.prefetch_weights:
+            self._prefetch_thread = threading.Thread(
+                target=_prefetch_demucs_weights,
+                args=(config.model_name,),
+                name="demucs-prefetch",
+                daemon=True,
+            )
+            self._prefetch_thread.start()
+
+    def _configure_cuda_backends(self) -> None:
+        """
+        Configures the global CUDA backend flags used by the Demucs forward pass.
+
+        TF32 routes the FP32 convolutions and matmuls through the tensor cores on
+        Ampere and newer GPUs. cuDNN autotuning is always enabled, since Demucs
+        feeds fixed-size chunks to the model and the selected algorithms are reused.
+        """
+        import torch
+
+        if self.config.tf32:
+            torch.set_float32_matmul_precision("high")
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
+            logger.info("TF32 tensor-core math enabled")
+        torch.backends.cudnn.benchmark = True
+
+    def _configure_cpu_threads(self) -> None:
+        """
+        Configures the CPU thread pools used by the Demucs forward pass.
+
+        The intra-op pool uses every core, defaulting to all the available CPUs,
+        while the inter-op pool is limited to a single thread: Demucs runs one
+        chunk at a time, so parallel operators would only compete for the cores.
+        """
+        import torch
+
+        num_threads = self.config.num_threads or os.cpu_count() or 1
+        torch.set_num_threads(num_threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Can only be set before any inter-op parallel work has started
+            logger.debug("The inter-op thread pool is already running")
+        logger.info("Demucs will use %s CPU threads", num_threads)
+
+    def _get_precision(self, device: str) -> str:
+        """
+        Resolves the configured precision for the device the model runs on.
+
+        "auto" picks BF16 on GPUs with native BF16 support (Ampere and newer),
+        which has the FP32 dynamic range, and FP16 on older GPUs. CPU inference
+        always runs in FP32.
+
+        Args:
+            device: The device the model runs on.
+
+        Returns:
+            "fp32", "fp16" or "bf16".
+        """
+        import torch
+
+        if device != "cuda":
+            return "fp32"
+        if self.config.precision == "auto":
+            return "bf16" if torch.cuda.is_bf16_supported() else "fp16"
+        return self.config.precision
+
+    def _autocast(
+        self, device: str
+    ) -> Union[torch.autocast, contextlib.nullcontext]:
+        """
+        Builds the autocast context for the Demucs forward pass.
+
+        Mixed precision is only used on CUDA, where FP16/BF16 convolutions and
+        matmuls are dispatched to the tensor cores; CPU inference stays in FP32.
+
+        Args:
+            device: The device the model runs on.
+
+        Returns:
+            An autocast context manager, or a no-op context when running in FP32.
+        """
+        import torch
+
+        precision = self._get_precision(device)
+        if precision == "fp32":
+            # Even a disabled CPU autocast warns about its FP16 default dtype
+            return contextlib.nullcontext()
+
+        logger.info("Demucs will run with %s autocast", precision)
+        # Cached weight casts would be baked into captured CUDA graphs
+        return torch.autocast(
+            device_type=device,
+            dtype=torch.bfloat16 if precision == "bf16" else torch.float16,
+            cache_enabled=not self.config.cuda_graphs,
+        )
+
+    def _get_demucs_instance(self, device: str) -> DemucsSeparator:
+        """
+        Gets the Demucs separator, compiling its model and capturing CUDA graphs
+        for it if so configured.
+
+        Separators are cached, so only the first separation pays for loading the
+        weights, and for the compilation and graph capture warm-up.
+
+        Args:
+            device: The device the model runs on.
+
+        Returns:
+            The Demucs separator instance.
+        """
+        compile_mode = self.config.compile_mode if self.config.compile_model else None
+        cuda_graphs = self.config.cuda_graphs and device == "cuda"
+
+        tensorrt_precision = None
+        if self.config.backend == "tensorrt":
+            if device != "cuda":
+                logger.warning("The TensorRT backend requires CUDA; using PyTorch")
+            else:
+                tensorrt_precision = self._get_precision(device)
+                if compile_mode is not None or cuda_graphs:
+                    logger.warning(
+                        "torch.compile and CUDA graphs do not apply to the TensorRT "
+                        "backend; skipping them"
+                    )
+                compile_mode, cuda_graphs = None, False
 
-    def separate(self, input_audio_path: str, output_audio_folder: str) -> None:
+        weights_precision = None
+        if self.config.half_weights:
+            precision = self._get_precision(device)
+            if precision == "fp32" or self.config.backend != "torch":
+                logger.warning(
+                    "Half-precision weights require CUDA autocast with the PyTorch "
+                    "backend; keeping FP32 weights"
+                )
+            else:
+                weights_precision = precision
+
+        torchscript = self.config.backend == "torchscript"
+        if torchscript and compile_mode is not None:
+            logger.warning("torch.compile does not apply to TorchScript; skipping it")
+            compile_mode = None
+
+        onnxruntime = self.config.backend == "onnxruntime"
+        if onnxruntime and device != "cpu":
+            logger.warning("The ONNX Runtime backend runs on CPU only; using PyTorch")
+            onnxruntime = False
+        elif onnxruntime and compile_mode is not None:
+            logger.warning("torch.compile does not apply to ONNX Runtime; skipping it")
+            compile_mode = None
+
+        if compile_mode == "reduce-overhead" and cuda_graphs:
+            logger.warning(
+                "torch.compile 'reduce-overhead' mode already uses CUDA graphs; "
+                "skipping explicit graph capture"
+            )
+            cuda_graphs = False
+
+        if self._prefetch_thread is not None:
+            self._prefetch_thread.join()
+
+        # Dynamic INT8 quantization only has CPU kernels
+        quantize = self.config.cpu_quantize and device == "cpu"
+
+        demucs_instance = _load_demucs_separator(
+            self.config.model_name,
+            device,
+            compile_mode,
+            cuda_graphs,
+            quantize,
+            torchscript,
+            onnxruntime,
+            tensorrt_precision,
+            weights_precision,
+        )
+        # Transformer models only accept chunks up to their training length
+        segment = self.config.segment
+        max_segment = _get_max_segment(demucs_instance.model)
+        if segment is not None and segment > max_segment:
+            logger.warning(
+                "Segment of %ss exceeds the %ss the model was trained on; using %ss",
+                segment,
+                max_segment,
+                max_segment,
+            )
+            segment = max_segment
+        self._segment = segment
+
+        demucs_instance.update_parameter(
+            shifts=self.config.shifts,
+            overlap=self.config.overlap,
+            segment=segment,
+        )
+        return demucs_instance
+
+    def _get_device(self) -> str:
+        """Selects the device Demucs runs on and configures its backends."""
+        import torch
+
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        logger.info("Demucs will use device: %s", device)
+        if device == "cuda":
+            self._configure_cuda_backends()
+        else:
+            self._configure_cpu_threads()
+        return device
+
+    def _get_output_path_for_song(
+        self, input_audio_path: str, output_audio_folder: str
+    ) -> Path:
+        """
+        Builds the folder the stems of a song are written to, creating it if needed.
+
+        Args:
+            input_audio_path: The path to the input audio file.
+            output_audio_folder: The root folder for the separated stems.
+
+        Returns:
+            The path '<output_audio_folder>/<model_name>/<song name>'.
+        """
+        output_path_for_song = (
+            Path(output_audio_folder)
+            / self.config.model_name
+            / Path(input_audio_path).stem
+        )
+        output_path_for_song.mkdir(parents=True, exist_ok=True)
+        return output_path_for_song
+
+    def _save_stems(
+        self,
+        separated_sources: dict[str, torch.Tensor],
+        output_path_for_song: Path,
+        samplerate: int,
+    ) -> None:
+        """
+        Writes each separated stem to
+        '<output_path_for_song>/<stem name>.<config.stem_format>'.
+
+        All the stems of a song have the same shape, so they are staged in a
+        single (pinned, for CUDA stems) host buffer. CUDA stems are copied to it on
+        a dedicated copy stream, and each file is written in its own thread as soon
+        as the copy of its stem has completed, so the transfer of a stem overlaps
+        with the writes of the previous ones, which release the GIL.
+
+        Args:
+            separated_sources: The separated stems, keyed by stem name.
+            output_path_for_song: The folder to write the stems to.
+            samplerate: The sample rate of the stems.
+        """
+        import torch
+
+        if not separated_sources:
+            return
+
+        stem_tensors = list(separated_sources.values())
+        channels, samples = stem_tensors[0].shape
+        is_cuda = stem_tensors[0].is_cuda
+        staging = torch.empty(
+            (len(stem_tensors), samples, channels),
+            dtype=torch.int16,
+            pin_memory=is_cuda,
+        )
+        if is_cuda and self._download_stream is None:
+            self._download_stream = torch.cuda.Stream()
+
+        with ThreadPoolExecutor(max_workers=len(stem_tensors)) as writer:
+            pending_writes = []
+            for (stem_name, stem_tensor), stem_staging in zip(
+                separated_sources.items(), staging
+            ):
+                pcm = _to_pcm(stem_tensor)
+                copied = None
+                if is_cuda:
+                    self._download_stream.wait_stream(torch.cuda.current_stream())
+                    with torch.cuda.stream(self._download_stream):
+                        stem_staging.copy_(pcm.t(), non_blocking=True)
+                    pcm.record_stream(self._download_stream)
+                    copied = torch.cuda.Event()
+                    copied.record(self._download_stream)
+                else:
+                    stem_staging.copy_(pcm.t())
+
+                stem_output_path = (
+                    output_path_for_song / f"{stem_name}.{self.config.stem_format}"
+                )
+                pending_write = writer.submit(
+                    _write_stem_when_ready,
+                    copied,
+                    stem_staging,
+                    os.fspath(stem_output_path),
+                    samplerate,
+                    self.config.stem_format,
+                    self.config.stem_bitrate,
+                )
+                pending_writes.append((stem_name, stem_output_path, pending_write))
+
+            for stem_name, stem_output_path, pending_write in pending_writes:
+                pending_write.result()
+                logger.info("Saved %s to %s", stem_name, stem_output_path)
+
+    def _release_cuda_memory(self, device: str, separated_files: int = 1) -> None:
+        """
+        Returns the cached GPU memory to the driver every
+        `config.empty_cache_every` separated files, so that the activation
+        high-water mark of a long song does not stay reserved for the whole run.
+
+        Args:
+            device: The device the model runs on.
+            separated_files: The number of files separated since the last call.
+        """
+        import torch
+
+        if device != "cuda" or self.config.empty_cache_every <= 0:
+            return
+        self._files_since_empty_cache += separated_files
+        if self._files_since_empty_cache >= self.config.empty_cache_every:
+            torch.cuda.empty_cache()
+            self._files_since_empty_cache = 0
+
+    def warm_up(self) -> None:
+        """
+        Loads the Demucs model, and applies its accelerations, ahead of time.
+
+        When the model is compiled or replays CUDA graphs, a few seconds of noise
+        are also separated, so the compilation and graph capture happen here
+        rather than on the first real song.
+        """
+        import torch
+
+        device = self._get_device()
+        demucs_instance = self._get_demucs_instance(device)
+        if device != "cuda" or not (
+            self.config.compile_model or self.config.cuda_graphs
+        ):
+            return
+
+        logger.info("Warming up the Demucs model...")
+        noise = torch.randn(
+            demucs_instance.audio_channels,
+            demucs_instance.samplerate * _WARM_UP_SECONDS,
+            device=device,
+        )
+        with torch.inference_mode(), self._autocast(device):
+            demucs_instance.separate_tensor(noise)
+
+    def separate(self, input_audio_path: str, output_audio_folder: str) -> bool:
         """
         Separates an audio file using the Demucs library.
         Demucs typically separates into: drums, bass, other, vocals.
         """
-        logger.info(f"--- Using Demucs library (model: {self.config.model_name}) ---")
+        import torch
+
+        logger.info("--- Using Demucs library (model: %s) ---", self.config.model_name)
         if not self._check_input_file(input_audio_path):
-            return
+            return False
 
         try:
-            device = "cuda" if torch.cuda.is_available() else "cpu"
-            logger.info(f"Demucs will use device: {device}")
+            device = self._get_device()
+            demucs_instance = self._get_demucs_instance(device)
 
-            demucs_instance = DemucsSeparator(
-                model=self.config.model_name, device=device
-            )
+            with torch.inference_mode():
+                logger.info(
+                    "Processing %s with Demucs model %s...",
+                    input_audio_path,
+                    self.config.model_name,
+                )
+                wav = _load_audio(input_audio_path, demucs_instance, device)
+                with self._autocast(device):
+                    _, separated_sources = demucs_instance.separate_tensor(wav)
 
-            logger.info(
-                f"Processing {input_audio_path} with Demucs model {self.config.model_name}..."
-            )
-            _, separated_sources = demucs_instance.separate_audio_file(
-                Path(input_audio_path)
-            )
+                output_path_for_song = self._get_output_path_for_song(
+                    input_audio_path, output_audio_folder
+                )
+                self._save_stems(
+                    separated_sources, output_path_for_song, demucs_instance.samplerate
+                )
+                logger.info(
+                    "Demucs separation complete. Output files are in %s",
+                    output_path_for_song,
+                )
+                del wav, separated_sources
+            self._release_cuda_memory(device)
 
-            input_audio_path_basename = os.path.basename(input_audio_path)
-            input_filename_base = os.path.splitext(input_audio_path_basename)[0]
-            output_path_for_song = os.path.join(
-                output_audio_folder, self.config.model_name, input_filename_base
-            )
+        except (RuntimeError, ValueError, IOError) as e:
+            logger.exception("Error during Demucs library processing: %s", e)
+            return False
+        return True
+
+    def separate_many(
+        self, input_audio_paths: list[str], output_audio_folder: str
+    ) -> list[str]:
+        """
+        Separates several audio files, overlapping data transfers with inference.
+
+        On CUDA, three things run concurrently: the next song is decoded into
+        pinned host memory in a background thread and uploaded on a copy stream
+        while the current song is separated on a compute stream, and the previous
+        song's stems are downloaded and written to disk by a saver thread. CUDA
+        events order the work across the two streams. On CPU this falls back to
+        separating the files one by one.
+
+        A file that cannot be decoded, separated or saved is logged and skipped,
+        without stopping the others.
+
+        Returns:
+            The paths of the files that were missing or could not be separated.
+        """
+        import torch
 
-            if not os.path.exists(output_path_for_song):
-                os.makedirs(output_path_for_song)
-                logger.info(f"Created output directory: {output_path_for_song}")
+        logger.info("--- Using Demucs library (model: %s) ---", self.config.model_name)
+        all_input_audio_paths = input_audio_paths
+        input_audio_paths = self._check_input_files(input_audio_paths)
+        if not input_audio_paths:
+            return list(all_input_audio_paths)
 
-            for stem_name, stem_tensor in separated_sources.items():
-                stem_output_path = os.path.join(
-                    output_path_for_song, f"{stem_name}.wav"
+        separated_paths = set()
+        try:
+            device = self._get_device()
+            if device != "cuda":
+                separated_paths.update(
+                    input_audio_path
+                    for input_audio_path in input_audio_paths
+                    if self.separate(input_audio_path, output_audio_folder)
+                )
+                return [p for p in all_input_audio_paths if p not in separated_paths]
+
+            demucs_instance = self._get_demucs_instance(device)
+            copy_stream = torch.cuda.Stream()
+            compute_stream = torch.cuda.Stream()
+
+            with (
+                ThreadPoolExecutor(max_workers=1) as decoder,
+                ThreadPoolExecutor(max_workers=1) as saver,
+                torch.inference_mode(),
+            ):
+                pending_decode = decoder.submit(
+                    _decode_audio, input_audio_paths[0], True
                 )
-                save_audio(
-                    stem_tensor, stem_output_path, samplerate=demucs_instance.samplerate
+                next_upload = _upload_when_decoded(
+                    pending_decode, input_audio_paths[0], device, copy_stream
                 )
-                logger.info(f"Saved {stem_name} to {stem_output_path}")
+                pending_saves = []
+
+                for index, input_audio_path in enumerate(input_audio_paths):
+                    upload = next_upload
+                    has_next = index + 1 < len(input_audio_paths)
+                    if has_next:
+                        pending_decode = decoder.submit(
+                            _decode_audio, input_audio_paths[index + 1], True
+                        )
+
+                    separated_sources = None
+                    if upload is not None:
+                        wav, samplerate, uploaded = upload
+                        logger.info(
+                            "Processing %s with Demucs model %s...",
+                            input_audio_path,
+                            self.config.model_name,
+                        )
+                        try:
+                            compute_stream.wait_event(uploaded)
+                            with (
+                                torch.cuda.stream(compute_stream),
+                                self._autocast(device),
+                            ):
+                                wav.record_stream(compute_stream)
+                                wav = _conform_audio(wav, samplerate, demucs_instance)
+                                _, separated_sources = demucs_instance.separate_tensor(
+                                    wav
+                                )
+                        except (RuntimeError, ValueError) as e:
+                            logger.exception(
+                                "Error during Demucs processing of %s: %s",
+                                input_audio_path,
+                                e,
+                            )
+                        del wav, upload
+                    computed = torch.cuda.Event()
+                    computed.record(compute_stream)
+
+                    # Queue the next upload ahead of this song's download, so that it
+                    # overlaps with the separation still running on the GPU
+                    if has_next:
+                        next_upload = _upload_when_decoded(
+                            pending_decode,
+                            input_audio_paths[index + 1],
+                            device,
+                            copy_stream,
+                        )
+                    if separated_sources is None:
+                        continue
+
+                    copy_stream.wait_event(computed)
+                    with torch.cuda.stream(copy_stream):
+                        host_sources = {}
+                        for stem_name, stem_tensor in separated_sources.items():
+                            stem_tensor.record_stream(copy_stream)
+                            host_sources[stem_name] = torch.empty(
+                                stem_tensor.shape, dtype=torch.float32, pin_memory=True
+                            ).copy_(stem_tensor, non_blocking=True)
+                    downloaded = torch.cuda.Event()
+                    downloaded.record(copy_stream)
+
+                    output_path_for_song = self._get_output_path_for_song(
+                        input_audio_path, output_audio_folder
+                    )
+                    pending_save = saver.submit(
+                        self._save_stems_when_ready,
+                        downloaded,
+                        host_sources,
+                        output_path_for_song,
+                        demucs_instance.samplerate,
+                    )
+                    pending_saves.append((input_audio_path, pending_save))
+                    del separated_sources
+                    self._release_cuda_memory(device)
+
+                for input_audio_path, pending_save in pending_saves:
+                    try:
+                        pending_save.result()
+                        separated_paths.add(input_audio_path)
+                    except (RuntimeError, ValueError, IOError) as e:
+                        logger.exception(
+                            "Could not save the stems of %s: %s", input_audio_path, e
+                        )
 
             logger.info(
-                f"Demucs separation complete. Output files are in {output_path_for_song}"
+                "Demucs separation complete. Output files are in %s",
+                output_audio_folder,
             )
 
         except (RuntimeError, ValueError, IOError) as e:
-            logger.error(f"Error during Demucs library processing: {e}", exc_info=True)
+            logger.exception("Error during Demucs library processing: %s", e)
+
+        return [p for p in all_input_audio_paths if p not in separated_paths]
+
+    def separate_batch(
+        self, input_audio_paths: list[str], output_audio_folder: str
+    ) -> list[str]:
+        """
+        Separates several audio files, running the model on batches of songs.
+
+        At batch size 1 the model under-utilizes the GPU, so up to
+        `config.batch_size` songs are zero-padded to the same length and stacked
+        into a single (batch, channels, samples) tensor, which `apply_model` splits
+        into chunks along time as usual. The stems are trimmed back to each song's
+        original length afterwards. The files of the next batch are decoded in
+        background threads while the model runs on the current one.
+
+        A file that cannot be decoded is logged and left out of its batch, and a
+        batch that fails is logged without stopping the next ones.
+
+        Returns:
+            The paths of the files that were missing or could not be separated.
+        """
+        import torch
+
+        logger.info("--- Using Demucs library (model: %s) ---", self.config.model_name)
+        all_input_audio_paths = input_audio_paths
+        input_audio_paths = self._check_input_files(input_audio_paths)
+        if not input_audio_paths:
+            return list(all_input_audio_paths)
+
+        separated_paths = set()
+        try:
+            device = self._get_device()
+            demucs_instance = self._get_demucs_instance(device)
+            batch_size = max(1, self.config.batch_size)
+            batches = [
+                input_audio_paths[start : start + batch_size]
+                for start in range(0, len(input_audio_paths), batch_size)
+            ]
+
+            # The next batch is decoded while the model runs on the current one
+            with ThreadPoolExecutor(max_workers=batch_size) as decoder:
+                pending_decodes = [decoder.submit(_decode_audio, p) for p in batches[0]]
+                for index, batch_paths in enumerate(batches):
+                    logger.info(
+                        "Processing a batch of %s files with Demucs...",
+                        len(batch_paths),
+                    )
+                    decoded = _decoded_results(batch_paths, pending_decodes)
+                    if index + 1 < len(batches):
+                        pending_decodes = [
+                            decoder.submit(_decode_audio, p) for p in batches[index + 1]
+                        ]
+                    # Files that could not be decoded are left out of the batch
+                    batch_paths = [path for path, _, _ in decoded]
+                    if not batch_paths:
+                        continue
+
+                    try:
+                        wavs = [
+                            _conform_audio(wav.to(device), samplerate, demucs_instance)
+                            for _, wav, samplerate in decoded
+                        ]
+                        del decoded
+
+                        with torch.inference_mode():
+                            with self._autocast(device):
+                                batch_sources = self._separate_wav_batch(
+                                    wavs, demucs_instance, device
+                                )
+
+                            for input_audio_path, separated_sources in zip(
+                                batch_paths, batch_sources
+                            ):
+                                output_path_for_song = self._get_output_path_for_song(
+                                    input_audio_path, output_audio_folder
+                                )
+                                self._save_stems(
+                                    separated_sources,
+                                    output_path_for_song,
+                                    demucs_instance.samplerate,
+                                )
+                                separated_paths.add(input_audio_path)
+                            del wavs, batch_sources, separated_sources
+                    except (RuntimeError, ValueError, IOError) as e:
+                        logger.exception(
+                            "Error during Demucs processing of a batch of %s files: %s",
+                            len(batch_paths),
+                            e,
+                        )
+                    self._release_cuda_memory(device, len(batch_paths))
+
+            logger.info(
+                "Demucs separation complete. Output files are in %s",
+                output_audio_folder,
+            )
+
+        except (RuntimeError, ValueError, IOError) as e:
+            logger.exception("Error during Demucs library processing: %s", e)
+
+        return [p for p in all_input_audio_paths if p not in separated_paths]
+
+    def _separate_wav_batch(
+        self,
+        wavs: list[torch.Tensor],
+        demucs_instance: DemucsSeparator,
+        device: str,
+    ) -> list[dict[str, torch.Tensor]]:
+        """
+        Runs a single batched model call over several waveforms.
+
+        Each waveform is normalized on its own, as `DemucsSeparator.separate_tensor`
+        does, before being padded, so the padding does not skew the statistics.
+
+        Args:
+            wavs: The waveforms to separate, each shaped (channels, samples).
+            demucs_instance: The Demucs separator whose model is used.
+            device: The device the model runs on.
+
+        Returns:
+            For each waveform, its separated stems keyed by stem name.
+        """
+        import torch
+        import torch.nn.functional as F
+        from demucs.apply import apply_model
+
+        lengths = [wav.shape[-1] for wav in wavs]
+        max_length = max(lengths)
+
+        normalized, means, stds = [], [], []
+        for wav in wavs:
+            ref = wav.mean(0)
+            mean, std = ref.mean(), ref.std() + 1e-8
+            padding = (0, max_length - wav.shape[-1])
+            normalized.append(F.pad((wav - mean) / std, padding))
+            means.append(mean)
+            stds.append(std)
+        batch = torch.stack(normalized).to(device)
+
+        out = apply_model(
+            demucs_instance.model,
+            batch,
+            shifts=self.config.shifts,
+            overlap=self.config.overlap,
+            segment=self._segment,
+            device=device,
+        )
+
+        sources = demucs_instance.model.sources
+        batch_sources = []
+        for index, length in enumerate(lengths):
+            stems = out[index, :, :, :length] * stds[index].to(out.device)
+            stems += means[index].to(out.device)
+            batch_sources.append(dict(zip(sources, stems)))
+        return batch_sources
+
+    def _save_stems_when_ready(
+        self,
+        downloaded: torch.cuda.Event,
+        host_sources: dict[str, torch.Tensor],
+        output_path_for_song: Path,
+        samplerate: int,
+    ) -> None:
+        """Waits for the stems to reach host memory, then writes them to disk."""
+        downloaded.synchronize()
+        self._save_stems(host_sources, output_path_for_song, samplerate)
+        logger.info("Output files are in %s", output_path_for_song)
+
+
+@functools.lru_cache(maxsize=4)
+def _load_spleeter_separator(
+    model_name: str, mixed_precision: bool, xla: bool, multiprocess: bool = True
+):
+    """
+    Loads a Spleeter separator, caching it so that the model is only built once.
+
+    Args:
+        model_name: The Spleeter model configuration, e.g. "spleeter:5stems".
+        mixed_precision: Whether to run the model in mixed FP16 precision on GPU.
+        xla: Whether to let XLA compile the model's graph on GPU.
+        multiprocess: Whether the separator writes the stems from its own pool of
+            processes.
+
+    Returns:
+        The `spleeter.separator.Separator` instance.
+    """
+    _configure_tensorflow(mixed_precision, xla)
+    from spleeter.separator import Separator as SpleeterLibSeparator
+
+    return SpleeterLibSeparator(model_name, multiprocess=multiprocess)
+
+
+def _configure_tensorflow(mixed_precision: bool, xla: bool) -> None:
+    """
+    Configures TensorFlow for Spleeter, before the model graph is built.
+
+    The asynchronous CUDA allocator and the XLA auto-clustering flag are read when
+    TensorFlow is first imported, so they are only set if the user did not. Mixed
+    precision and XLA are only enabled when a GPU is visible: on CPU, FP16 math is
+    emulated and slower than FP32.
+
+    Args:
+        mixed_precision: Whether to build the Keras layers with the global
+            "mixed_float16" policy, which runs the convolutions on tensor cores.
+            Experimental: it is not verified that Spleeter's masks stay finite
+            and match FP32 under it.
+        xla: Whether to compile the graph into fused XLA kernels. Experimental:
+            Spleeter feeds waveforms of variable length, and the benefit over
+            the recompilations this may cause is not measured on real tracks.
+    """
+    os.environ.setdefault("TF_GPU_ALLOCATOR", "cuda_malloc_async")
+    if xla:
+        os.environ.setdefault("TF_XLA_FLAGS", "--tf_xla_auto_jit=2")
+
+    import tensorflow as tf
+
+    if not tf.config.list_physical_devices("GPU"):
+        return
+    if xla:
+        tf.config.optimizer.set_jit(True)
+        logger.info("XLA compilation enabled for Spleeter")
+    if mixed_precision:
+        tf.keras.mixed_precision.set_global_policy("mixed_float16")
+        logger.info("Mixed FP16 precision enabled for Spleeter")
+
+
+# Spleeter separator of the current process pool worker
+_spleeter_worker_instance = None
+
+
+def _init_spleeter_worker(model_name: str, mixed_precision: bool, xla: bool) -> None:
+    """
+    Builds the Spleeter separator of a process pool worker.
+
+    The separator's own process pool is disabled: the workers already run in
+    parallel, and each would otherwise fork a pool of the size of the CPU count
+    from a process that has TensorFlow loaded.
+    """
+    global _spleeter_worker_instance
+    _spleeter_worker_instance = _load_spleeter_separator(
+        model_name, mixed_precision, xla, multiprocess=False
+    )
+
+
+def _separate_in_spleeter_worker(
+    input_audio_path: str, output_audio_folder: str
+) -> bool:
+    """
+    Separates an audio file with the Spleeter separator of the current worker.
+
+    Returns:
+        True if the file was separated, False if the failure was logged.
+    """
+    try:
+        _spleeter_worker_instance.separate_to_file(
+            input_audio_path, output_audio_folder
+        )
+    # Spleeter surfaces TensorFlow and ffmpeg failures with their own types
+    except Exception as e:
+        logger.exception(
+            "Error during Spleeter processing of %s: %s", input_audio_path, e
+        )
+        return False
+    return True
+
+
+@functools.lru_cache(maxsize=4)
+def _load_demucs_separator(
+    model_name: str,
+    device: str,
+    compile_mode: Optional[str],
+    cuda_graphs: bool,
+    quantize: bool,
+    torchscript: bool,
+    onnxruntime: bool,
+    tensorrt_precision: Optional[str],
+    weights_precision: Optional[str],
+) -> DemucsSeparator:
+    """
+    Loads a Demucs separator, caching it so that the weights are only loaded and
+    moved to the device once.
+
+    Args:
+        model_name: The Demucs model to load.
+        device: The device the model runs on.
+        compile_mode: The `torch.compile` mode, or None to run the model eagerly.
+        cuda_graphs: Whether to replay the model's forward pass from CUDA graphs.
+        quantize: Whether to quantize the model's Linear/LSTM weights to INT8.
+        torchscript: Whether to run the model as frozen TorchScript modules.
+        onnxruntime: Whether to run the model with ONNX Runtime CPU sessions, in
+            which case the quantization, if any, is done by ONNX Runtime.
+        tensorrt_precision: The precision of the TensorRT engines to run the model
+            with, or None to run it with PyTorch.
+        weights_precision: "fp16" or "bf16" to cast the model's weights to half
+            precision, or None to keep them in FP32.
+
+    Returns:
+        The Demucs separator instance.
+    """
+    import torch
+    from demucs.api import Separator as DemucsSeparator
+    from audio_source_separator.accelerators import (
+        capture_demucs_cuda_graphs,
+        cast_demucs_weights,
+        compile_demucs_model,
+        quantize_demucs_model,
+        use_torchscript_backend,
+    )
+    from audio_source_separator.onnx_backends import (
+        use_onnxruntime_backend,
+        use_tensorrt_backend,
+    )
+
+    _set_demucs_cache_dir()
+    demucs_instance = DemucsSeparator(model=model_name, device=device)
+    # The separator keeps the weights on the CPU, and apply_model would move each
+    # network of a bag to the device and back on every call; keeping them
+    # resident also lets the accelerators below work on the device weights
+    demucs_instance.model.to(device)
+    if weights_precision is not None:
+        dtype = torch.bfloat16 if weights_precision == "bf16" else torch.float16
+        cast_demucs_weights(demucs_instance.model, dtype)
+    if onnxruntime and use_onnxruntime_backend(
+        demucs_instance.model, model_name, quantize
+    ):
+        quantize = False
+    if quantize:
+        quantize_demucs_model(demucs_instance.model)
+    if torchscript:
+        cache_key = f"{model_name}-int8" if quantize else model_name
+        use_torchscript_backend(demucs_instance.model, cache_key, device)
+    if tensorrt_precision is not None:
+        use_tensorrt_backend(demucs_instance.model, model_name, tensorrt_precision)
+    if compile_mode is not None:
+        compile_demucs_model(demucs_instance.model, mode=compile_mode)
+    if cuda_graphs:
+        capture_demucs_cuda_graphs(demucs_instance.model)
+    return demucs_instance
+
+
+def _get_cuda_alloc_conf() -> str:
+    """
+    Builds the default configuration of the CUDA caching allocator.
+
+    Large blocks are never split, so long songs do not fragment the cache.
+    Expandable segments, which let freed memory be returned to the driver, are
+    only known to torch 2.1 and newer: older versions reject the whole setting on
+    the first CUDA allocation. The installed version is read from the package
+    metadata, so torch is not imported here.
+
+    Returns:
+        The value for the PYTORCH_CUDA_ALLOC_CONF environment variable.
+    """
+    alloc_conf = "max_split_size_mb:512"
+    try:
+        torch_version = importlib.metadata.version("torch")
+    except importlib.metadata.PackageNotFoundError:
+        return alloc_conf
+
+    major, minor = (int(part) for part in re.findall(r"\d+", torch_version)[:2])
+    if (major, minor) >= (2, 1):
+        alloc_conf = f"expandable_segments:True,{alloc_conf}"
+    return alloc_conf
+
+
+def _get_max_segment(model) -> float:
+    """
+    Returns the longest chunk, in seconds, a Demucs model can be applied to.
+
+    Args:
+        model: A Demucs model, either a single network or a bag of networks.
+
+    Returns:
+        The training segment of transformer models, or infinity for the
+        convolutional models, which accept chunks of any length.
+    """
+    from demucs.htdemucs import HTDemucs
+
+    if isinstance(model, HTDemucs):
+        return float(model.segment)
+    return getattr(model, "max_allowed_segment", float("inf"))
+
+
+def _set_demucs_cache_dir() -> None:
+    """
+    Points the torch hub cache, where Demucs stores its weights, at the folder
+    set in the DEMUCS_CACHE_DIR environment variable, if any. A tmpfs folder such
+    as /dev/shm avoids reading the weights from slow storage on every cold start.
+    """
+    import torch
+
+    cache_dir = os.environ.get("DEMUCS_CACHE_DIR")
+    if cache_dir:
+        torch.hub.set_dir(cache_dir)
+
+
+def _prefetch_demucs_weights(model_name: str) -> None:
+    """
+    Downloads the checkpoints of a pretrained Demucs model into the torch hub cache,
+    where `torch.hub.load_state_dict_from_url` looks for them, without loading
+    them: the download overlaps with the rest of the start-up, and the checkpoints
+    are still only deserialized once, by `DemucsSeparator`. Errors are only logged,
+    as the actual load will report them.
+
+    Args:
+        model_name: The Demucs model to prefetch, a bag of models name or a
+            pretrained signature.
+    """
+    import torch
+    import yaml
+    from demucs.pretrained import REMOTE_ROOT, _parse_remote_files
+
+    _set_demucs_cache_dir()
+    try:
+        checkpoint_urls = _parse_remote_files(REMOTE_ROOT / "files.txt")
+        bag_file = REMOTE_ROOT / f"{model_name}.yaml"
+        signatures = (
+            yaml.safe_load(bag_file.read_text())["models"]
+            if bag_file.exists()
+            else [model_name]
+        )
+        checkpoint_dir = Path(torch.hub.get_dir()) / "checkpoints"
+        checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        for signature in signatures:
+            checkpoint_url = checkpoint_urls[signature]
+            file_name = checkpoint_url.rsplit("/", 1)[-1]
+            if (checkpoint_dir / file_name).exists():
+                continue
+            hash_match = torch.hub.HASH_REGEX.search(file_name)
+            torch.hub.download_url_to_file(
+                checkpoint_url,
+                str(checkpoint_dir / file_name),
+                hash_match.group(1) if hash_match else None,
+                progress=False,
+            )
+        logger.info("Prefetched Demucs model %s", model_name)
+    except (KeyError, OSError, RuntimeError, yaml.YAMLError) as e:
+        logger.warning("Could not prefetch Demucs model %s: %s", model_name, e)
+
+
+def _decode_audio(
+    input_audio_path: str, pin_memory: bool = False
+) -> tuple[torch.Tensor, int]:
+    """
+    Decodes an audio file at its native sample rate.
+
+    The file is streamed block by block with soundfile, straight into the
+    (optionally pinned) waveform tensor, so no full-length intermediate copy is
+    made; the libsndfile bundled with soundfile 0.12 and later reads MP3 as well.
+    Formats libsndfile cannot read are decoded with torchaudio, with the ffmpeg
+    command line as the last fallback, as Demucs itself does.
+
+    Args:
+        input_audio_path: The path to the audio file.
+        pin_memory: Whether to return the waveform in pinned host memory, so that
+            it can be uploaded to the GPU asynchronously.
+
+    Returns:
+        The decoded waveform, shaped (channels, samples), and its sample rate.
+
+    Raises:
+        RuntimeError: If no decoder can read the file.
+    """
+    import torchaudio
+    from demucs.audio import AudioFile
+
+    try:
+        return _stream_decode_audio(input_audio_path, pin_memory)
+    except (ImportError, RuntimeError) as e:
+        logger.debug("Could not stream %s with soundfile: %s", input_audio_path, e)
+
+    try:
+        wav, samplerate = torchaudio.load(input_audio_path)
+    except RuntimeError:
+        # ffprobe and ffmpeg failures surface as CalledProcessError, and a file
+        # without an audio stream as IndexError; as Demucs's own LoadAudioError,
+        # they are raised as a single type that every caller handles
+        try:
+            audio_file = AudioFile(Path(input_audio_path))
+            wav, samplerate = audio_file.read(streams=0), audio_file.samplerate()
+        except (subprocess.CalledProcessError, IndexError) as e:
+            raise RuntimeError(f"Could not decode {input_audio_path}: {e}") from e
+    return (wav.pin_memory() if pin_memory else wav), samplerate
+
+
+def _stream_decode_audio(
+    input_audio_path: str, pin_memory: bool
+) -> tuple[torch.Tensor, int]:
+    """
+    Decodes an audio file with soundfile, one block of frames at a time.
+
+    Args:
+        input_audio_path: The path to the audio file.
+        pin_memory: Whether to allocate the waveform in pinned host memory.
+
+    Returns:
+        The decoded waveform, shaped (channels, samples), and its sample rate.
+
+    Raises:
+        ImportError: If soundfile is not installed.
+        RuntimeError: If libsndfile cannot read the file, or the file has more
+            frames than its header reports.
+    """
+    import soundfile
+    import torch
+
+    with soundfile.SoundFile(input_audio_path) as sound_file:
+        frames = sound_file.frames
+        wav = torch.empty(
+            (sound_file.channels, frames), dtype=torch.float32, pin_memory=pin_memory
+        )
+        offset = 0
+        for block in sound_file.blocks(
+            blocksize=_DECODE_BLOCK_FRAMES, dtype="float32", always_2d=True
+        ):
+            block_frames = len(block)
+            if offset + block_frames > frames:
+                # The frame count of compressed formats is only an estimate
+                raise RuntimeError(f"{input_audio_path} is longer than its header says")
+            wav[:, offset : offset + block_frames] = torch.from_numpy(block).t()
+            offset += block_frames
+        return wav[:, :offset], sound_file.samplerate
+
+
+def _conform_audio(
+    wav: torch.Tensor, samplerate: int, demucs_instance: DemucsSeparator
+) -> torch.Tensor:
+    """
+    Converts a waveform to the model's channel count and sample rate, on whatever
+    device the waveform is on.
+
+    The resampling uses a Kaiser-windowed sinc kernel, which is built once per
+    pair of sample rates and device and reused for every song.
+
+    Args:
+        wav: The waveform, shaped (channels, samples).
+        samplerate: The sample rate of the waveform.
+        demucs_instance: The Demucs separator the waveform is conformed for.
+
+    Returns:
+        The converted waveform.
+    """
+    from demucs.audio import convert_audio_channels
+
+    wav = convert_audio_channels(wav, demucs_instance.audio_channels)
+    if samplerate != demucs_instance.samplerate:
+        resampler = _get_resampler(
+            samplerate, demucs_instance.samplerate, str(wav.device)
+        )
+        wav = resampler(wav)
+    return wav
+
+
+@functools.lru_cache(maxsize=8)
+def _get_resampler(orig_samplerate: int, new_samplerate: int, device: str):
+    """
+    Builds a resampler, caching it so that its filter kernel is only computed once.
+
+    Args:
+        orig_samplerate: The sample rate of the input waveforms.
+        new_samplerate: The sample rate to resample to.
+        device: The device the waveforms are on.
+
+    Returns:
+        The `torchaudio.transforms.Resample` module, on the device.
+    """
+    import torchaudio
+
+    return torchaudio.transforms.Resample(
+        orig_samplerate, new_samplerate, resampling_method="kaiser_window"
+    ).to(device)
+
+
+def _load_audio(
+    input_audio_path: str, demucs_instance: DemucsSeparator, device: str
+) -> torch.Tensor:
+    """
+    Decodes an audio file once and prepares it on the device for the model.
+
+    The waveform is moved to the device before resampling, so on CUDA the
+    resampling runs on the GPU instead of inside Demucs on the CPU.
+
+    Args:
+        input_audio_path: The path to the audio file.
+        demucs_instance: The Demucs separator the audio is loaded for.
+        device: The device the model runs on.
+
+    Returns:
+        The waveform on the device, shaped (channels, samples).
+    """
+    wav, samplerate = _decode_audio(input_audio_path)
+    return _conform_audio(wav.to(device), samplerate, demucs_instance)
+
+
+def _to_pcm(stem_tensor: torch.Tensor) -> torch.Tensor:
+    """
+    Quantizes a stem to 16-bit PCM on its own device, as `demucs.audio.save_audio`
+    does, so only 16-bit samples cross to the host.
+
+    Args:
+        stem_tensor: The stem to quantize, shaped (channels, samples).
+
+    Returns:
+        The stem rescaled to prevent clipping, as int16 samples.
+    """
+    import torch
+    from demucs.audio import prevent_clip
+
+    pcm = prevent_clip(stem_tensor.float(), mode="rescale")
+    return (pcm * 2**15).clamp_(-(2**15), 2**15 - 1).to(torch.int16)
+
+
+def _write_stem_when_ready(
+    copied: Optional[torch.cuda.Event],
+    staging: torch.Tensor,
+    stem_output_path: str,
+    samplerate: int,
+    stem_format: str,
+    bitrate: int,
+) -> None:
+    """
+    Waits for the samples to reach the staging buffer, then writes them.
+
+    WAV files are written directly. FLAC and MP3 files are encoded from the same
+    16-bit samples, with torchaudio and with the Demucs MP3 encoder respectively.
+
+    Args:
+        copied: The event recorded after the copy to the staging buffer, or None
+            if the samples are already there.
+        staging: The host buffer holding the samples, shaped (samples, channels).
+        stem_output_path: The path of the file to write.
+        samplerate: The sample rate of the stem.
+        stem_format: The format of the file, "wav", "flac" or "mp3".
+        bitrate: The bitrate of MP3 files, in kbps.
+    """
+    if copied is not None:
+        copied.synchronize()
+
+    if stem_format == "wav":
+        _write_wav(staging, stem_output_path, samplerate)
+    elif stem_format == "flac":
+        import torchaudio
+
+        torchaudio.save(
+            stem_output_path,
+            staging,
+            samplerate,
+            channels_first=False,
+            format="flac",
+            bits_per_sample=16,
+        )
+    else:
+        from demucs.audio import encode_mp3
+
+        encode_mp3(staging.t(), stem_output_path, samplerate, bitrate=bitrate)
+
+
+def _write_wav(staging: torch.Tensor, stem_output_path: str, samplerate: int) -> None:
+    """
+    Writes staged 16-bit PCM samples as a WAV file.
+
+    The header and the samples are written with a single gather write where
+    `os.writev` is available, or through a large buffer otherwise.
+
+    Args:
+        staging: The host buffer holding the samples, shaped (samples, channels).
+        stem_output_path: The path of the WAV file to write.
+        samplerate: The sample rate of the stem.
+    """
+    samples, channels = staging.shape
+    if not hasattr(os, "writev"):
+        with open(
+            stem_output_path, "wb", buffering=_STEM_WRITE_BUFFER_SIZE
+        ) as stem_file:
+            with wave.open(stem_file, "wb") as wav_file:
+                wav_file.setnchannels(channels)
+                wav_file.setsampwidth(2)
+                wav_file.setframerate(samplerate)
+                wav_file.writeframes(staging.numpy())
+        return
+
+    header = _wav_header(channels, samplerate, samples)
+    fd = os.open(stem_output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        _write_all(fd, [header, staging.numpy()])
+    finally:
+        os.close(fd)
+
+
+def _wav_header(channels: int, samplerate: int, samples: int) -> bytes:
+    """Builds the RIFF header of a 16-bit PCM WAV file."""
+    block_align = channels * 2
+    data_size = samples * block_align
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF",
+        36 + data_size,
+        b"WAVE",
+        b"fmt ",
+        16,
+        1,
+        channels,
+        samplerate,
+        samplerate * block_align,
+        block_align,
+        16,
+        b"data",
+        data_size,
+    )
+
+
+def _write_all(fd: int, buffers: list) -> None:
+    """
+    Writes the buffers to a file descriptor with as few `os.writev` calls as
+    possible, resuming after partial writes.
+    """
+    views = [memoryview(buffer).cast("B") for buffer in buffers]
+    while views:
+        written = os.writev(fd, views)
+        while views and written >= len(views[0]):
+            written -= len(views.pop(0))
+        if views and written:
+            views[0] = views[0][written:]
+
+
+def _decoded_results(
+    input_audio_paths: list[str], pending_decodes: list[Future]
+) -> list[tuple[str, torch.Tensor, int]]:
+    """
+    Waits for the files of a batch to be decoded.
+
+    Args:
+        input_audio_paths: The paths of the files, in the order of their decodes.
+        pending_decodes: The `_decode_audio` futures of the files.
+
+    Returns:
+        The path, waveform and sample rate of each decoded file. Files that could
+        not be decoded are logged and left out.
+    """
+    decoded = []
+    for input_audio_path, pending_decode in zip(input_audio_paths, pending_decodes):
+        try:
+            wav, samplerate = pending_decode.result()
+        except (RuntimeError, ValueError, IOError) as e:
+            logger.exception("Could not decode %s: %s", input_audio_path, e)
+            continue
+        decoded.append((input_audio_path, wav, samplerate))
+    return decoded
+
+
+def _upload_when_decoded(
+    pending_decode: Future,
+    input_audio_path: str,
+    device: str,
+    copy_stream: torch.cuda.Stream,
+) -> Optional[tuple[torch.Tensor, int, torch.cuda.Event]]:
+    """
+    Waits for a file to be decoded, then uploads it as `_upload` does.
+
+    Returns:
+        The result of `_upload`, or None if the file could not be decoded, which
+        is logged.
+    """
+    try:
+        host_wav, samplerate = pending_decode.result()
+    except (RuntimeError, ValueError, IOError) as e:
+        logger.exception("Could not decode %s: %s", input_audio_path, e)
+        return None
+    return _upload(host_wav, samplerate, device, copy_stream)
+
+
+def _upload(
+    host_wav: torch.Tensor,
+    samplerate: int,
+    device: str,
+    copy_stream: torch.cuda.Stream,
+) -> tuple[torch.Tensor, int, torch.cuda.Event]:
+    """
+    Copies a pinned host waveform to the device on the given copy stream.
+
+    Returns:
+        The device waveform, its sample rate, and the event recorded once the copy
+        completes.
+    """
+    import torch
+
+    with torch.cuda.stream(copy_stream):
+        wav = host_wav.to(device, non_blocking=True)
+    uploaded = torch.cuda.Event()
+    uploaded.record(copy_stream)
+    return wav, samplerate, uploaded
 
 
 class AudioSeparatorFactory:
@@ -167,18 +1649,26 @@ class AudioSeparatorFactory:
     Factory class for creating audio separator instances based on the specified tool.
     """
 
-    _registry = {
-        SeparationTool.SPLEETER: (SpleeterAudioSeparator, SpleeterConfig),
-        SeparationTool.DEMUCS: (DemucsAudioSeparator, DemucsConfig),
-    }
+    _registry = MappingProxyType(
+        {
+            SeparationTool.SPLEETER: (SpleeterAudioSeparator, SpleeterConfig),
+            SeparationTool.DEMUCS: (DemucsAudioSeparator, DemucsConfig),
+        }
+    )
 
     @classmethod
-    def create_separator(cls, separation_tool: SeparationTool) -> AudioSeparator:
+    def create_separator(
+        cls,
+        separation_tool: SeparationTool,
+        config: Optional[AudioSeparatorConfig] = None,
+    ) -> AudioSeparator:
         """
         Creates and returns an instance of the appropriate audio separator.
 
         Args:
             separation_tool: The type of separation tool to create.
+            config: The configuration of the separator. Defaults to the default
+                configuration of the selected tool.
 
         Returns:
             An instance of a class derived from AudioSeparator.
@@ -186,11 +1676,12 @@ class AudioSeparatorFactory:
         Raises:
             ValueError: If the specified separation_tool is unsupported.
         """
-        if separation_tool not in cls._registry:
+        registry_entry = cls._registry.get(separation_tool)
+        if registry_entry is None:
             err_msg = f"Unsupported separation tool: '{separation_tool}'"
             logger.error(err_msg)
             raise ValueError(err_msg)
 
-        SeparatorClass, SeparatorConfigClass = cls._registry[separation_tool]
-        separator_config = SeparatorConfigClass()
+        SeparatorClass, SeparatorConfigClass = registry_entry
+        separator_config = config if config is not None else SeparatorConfigClass()
         return SeparatorClass(config=separator_config)
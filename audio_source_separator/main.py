@@ -7,16 +7,33 @@ import argparse
 import logging
 import os
 import sys
+from types import MappingProxyType
 from audio_source_separator.audio_separators import (
     AudioSeparator,
+    DemucsConfig,
     SeparationTool,
     AudioSeparatorFactory,
 )
+from audio_source_separator.server import serve, submit
 
 
 # Get a logger instance for this module
 logger = logging.getLogger(__name__)
 
+# Extensions of the files picked up from input folders; explicit file arguments
+# are separated whatever their extension
+_AUDIO_EXTENSIONS = frozenset(
+    {".wav", ".mp3", ".flac", ".ogg", ".m4a", ".aac", ".aiff", ".aif", ".opus"}
+)
+
+# Configurations the persistent server uses instead of the tool defaults; the
+# server amortizes the graph capture warm-up across all its jobs
+_SERVER_CONFIGS = MappingProxyType(
+    {
+        SeparationTool.DEMUCS: DemucsConfig(cuda_graphs=True),
+    }
+)
+
 
 def _parse_command_line_args() -> argparse.Namespace:
     """
@@ -41,10 +58,11 @@ def _parse_command_line_args() -> argparse.Namespace:
     parser.add_argument(
         "-i",
         "--input",
-        dest="input_audio_file",
+        dest="input_audio_paths",
         type=str,
+        nargs="+",
         default=None,
-        help="Path to the input audio file (default: sample_audio/tijucos-no-dia-que-de.mp3).",
+        help="Paths to the input audio files, or to folders of audio files, which are all separated with a single model load.",
     )
     parser.add_argument(
         "-o",
@@ -54,11 +72,113 @@ def _parse_command_line_args() -> argparse.Namespace:
         default=None,
         help="Path to the output folder. If not provided, defaults to 'output_stems/<selected_tool_name>'.",
     )
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=None,
+        help="Separate the input files in batches of this many songs per model call (Demucs only).",
+    )
+    server_group = parser.add_mutually_exclusive_group()
+    server_group.add_argument(
+        "--server",
+        metavar="SOCKET",
+        default=None,
+        help="Run as a persistent separation server listening on the given Unix socket.",
+    )
+    server_group.add_argument(
+        "--client",
+        metavar="SOCKET",
+        default=None,
+        help="Submit the input file to the separation server listening on the given Unix socket.",
+    )
 
     args = parser.parse_args()
     return args
 
 
+def _collect_input_files(input_audio_paths: list[str]) -> list[str]:
+    """
+    Expands the input paths into the list of audio files to separate.
+
+    Args:
+        input_audio_paths: Paths to audio files, or to folders whose audio files
+            are all separated, in name order. Hidden files and files without an
+            audio extension are skipped.
+
+    Returns:
+        The paths of the audio files to separate.
+    """
+    input_audio_files = []
+    for input_audio_path in input_audio_paths:
+        if os.path.isdir(input_audio_path):
+            with os.scandir(input_audio_path) as entries:
+                input_audio_files.extend(
+                    sorted(
+                        entry.path
+                        for entry in entries
+                        if not entry.name.startswith(".")
+                        and os.path.splitext(entry.name)[1].lower() in _AUDIO_EXTENSIONS
+                        and entry.is_file()
+                    )
+                )
+        else:
+            input_audio_files.append(input_audio_path)
+    return input_audio_files
+
+
+def _submit_to_server(
+    socket_path: str, input_audio_files: list[str], output_folder: str
+) -> int:
+    """
+    Submits a separation job per input file to a running separation server.
+
+    Args:
+        socket_path: The path of the Unix socket the server listens on.
+        input_audio_files: The paths to the audio files to separate.
+        output_folder: The folder to write the separated stems to.
+
+    Returns:
+        The exit status of the script.
+    """
+    if not input_audio_files:
+        logger.critical("An input file is required in client mode")
+        return os.EX_USAGE
+
+    for input_audio_file in input_audio_files:
+        try:
+            response = submit(socket_path, input_audio_file, output_folder)
+        except OSError as e:
+            logger.critical("Could not reach the separation server: %s", e)
+            return os.EX_UNAVAILABLE
+
+        if response.get("status") != "done":
+            logger.critical("Separation server error: %s", response.get("message"))
+            return os.EX_SOFTWARE
+        logger.info("Separation of %s complete", input_audio_file)
+    return os.EX_OK
+
+
+def _exit_status(failed_paths: list[str]) -> int:
+    """
+    Reports the files a multi-file separation could not separate.
+
+    Args:
+        failed_paths: The paths of the files that were missing or failed.
+
+    Returns:
+        The exit status of the script.
+    """
+    if not failed_paths:
+        return os.EX_OK
+    logger.critical(
+        "Separation failed for %s file(s): %s",
+        len(failed_paths),
+        ", ".join(failed_paths),
+    )
+    return os.EX_SOFTWARE
+
+
 def main() -> int:
     logging.basicConfig(
         level=logging.INFO,
@@ -71,16 +191,55 @@ def main() -> int:
     if output_folder is None:
         output_folder = f"output_stems/{args.tool.value}"
 
+    input_audio_files = _collect_input_files(args.input_audio_paths or [])
+
+    if args.client is not None:
+        return _submit_to_server(args.client, input_audio_files, output_folder)
+
     try:
+        if args.server is not None:
+            separator = AudioSeparatorFactory.create_separator(
+                args.tool, _SERVER_CONFIGS.get(args.tool)
+            )
+            serve(separator, args.server)
+            return os.EX_OK
+
+        if not input_audio_files:
+            logger.critical("An input file is required")
+            return os.EX_USAGE
+
+        if args.batch_size is not None:
+            if args.tool != SeparationTool.DEMUCS:
+                logger.critical("Batched separation is only supported by Demucs")
+                return os.EX_USAGE
+            separator = AudioSeparatorFactory.create_separator(
+                args.tool, DemucsConfig(batch_size=args.batch_size)
+            )
+            failed_paths = separator.separate_batch(
+                input_audio_paths=input_audio_files,
+                output_audio_folder=output_folder,
+            )
+            return _exit_status(failed_paths)
+
         separator: AudioSeparator = AudioSeparatorFactory.create_separator(args.tool)
-        separator.separate(
-            input_audio_path=args.input_audio_file,
+        if len(input_audio_files) == 1:
+            if not separator.separate(
+                input_audio_path=input_audio_files[0],
+                output_audio_folder=output_folder,
+            ):
+                logger.critical("Separation of %s failed", input_audio_files[0])
+                return os.EX_SOFTWARE
+            return os.EX_OK
+
+        # The model is loaded once and reused for every file
+        failed_paths = separator.separate_many(
+            input_audio_paths=input_audio_files,
             output_audio_folder=output_folder,
         )
-        return os.EX_OK
+        return _exit_status(failed_paths)
 
     except ValueError as e:
-        logger.critical(f"Terminating due to error: {e}")
+        logger.critical("Terminating due to error: %s", e)
         return os.EX_SOFTWARE
 
 
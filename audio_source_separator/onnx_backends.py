@@ -0,0 +1,525 @@
+"""
+Inference backends that run the Demucs networks from an ONNX export, such as
+TensorRT engines or ONNX Runtime sessions, in place of the eager PyTorch forward
+pass.
+"""
+
+import importlib
+import logging
+from pathlib import Path
+import torch
+from torch import nn
+from torch._C import _onnx as _C_onnx
+from torch.onnx import symbolic_helper
+from audio_source_separator.accelerators import iter_demucs_networks
+
+logger = logging.getLogger(__name__)
+
+# Names of the inputs and outputs of the exported ONNX graphs
+_ONNX_INPUT_NAMES = ("mag", "mix")
+_ONNX_OUTPUT_NAMES = ("freq_sources", "time_sources")
+_ONNX_OPSET_VERSION = 17
+
+
+def get_backend_cache_dir(backend_name: str) -> Path:
+    """
+    Returns the folder the exported models of a backend are cached in, next to the
+    torch hub cache where the Demucs weights are stored.
+
+    Args:
+        backend_name: The name of the backend, e.g. "tensorrt".
+
+    Returns:
+        The cache folder, created if needed.
+    """
+    cache_dir = Path(torch.hub.get_dir()) / "audio_source_separator" / backend_name
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+def get_chunk_shape(network: nn.Module) -> tuple[int, int, int]:
+    """
+    Returns the fixed (batch, channels, samples) shape of the chunks that
+    `demucs.apply.apply_model` feeds to an HTDemucs network.
+
+    Args:
+        network: The HTDemucs network.
+
+    Returns:
+        The shape of a single chunk.
+
+    Raises:
+        ValueError: If the network is not an HTDemucs network.
+    """
+    from demucs.htdemucs import HTDemucs
+
+    if not isinstance(network, HTDemucs):
+        raise ValueError(
+            f"Only HTDemucs networks have a fixed chunk shape, got {type(network).__name__}"
+        )
+    return 1, network.audio_channels, int(network.segment * network.samplerate)
+
+
+class HTDemucsCore(nn.Module):
+    """
+    The part of an HTDemucs network between its STFT and its inverse STFT.
+
+    torch.onnx has no symbolic for aten::stft or aten::istft, so only this part
+    of the network is exported, and `spectral_forward` runs the transforms around
+    it in PyTorch. The forward pass mirrors `HTDemucs.forward` in eval mode, for
+    an input of the training length.
+    """
+
+    def __init__(self, network: nn.Module):
+        super().__init__()
+        self.network = network
+
+    def forward(
+        self, mag: torch.Tensor, mix: torch.Tensor
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        Args:
+            mag: The spectrogram of the mix, as returned by `HTDemucs._magnitude`.
+            mix: The mix, of shape (batch, channels, samples).
+
+        Returns:
+            The output of the frequency branch, to be masked and inverted, and the
+            output of the time branch, of shape (batch, sources, channels,
+            samples).
+        """
+        from einops import rearrange
+
+        network = self.network
+        B, C, Fq, T = mag.shape
+        length = mix.shape[-1]
+
+        mean = mag.mean(dim=(1, 2, 3), keepdim=True)
+        std = mag.std(dim=(1, 2, 3), keepdim=True)
+        x = (mag - mean) / (1e-5 + std)
+        meant = mix.mean(dim=(1, 2), keepdim=True)
+        stdt = mix.std(dim=(1, 2), keepdim=True)
+        xt = (mix - meant) / (1e-5 + stdt)
+
+        # Skip connections and lengths of the frequency and time branches
+        saved, saved_t, lengths, lengths_t = [], [], [], []
+        for idx, encode in enumerate(network.encoder):
+            lengths.append(x.shape[-1])
+            inject = None
+            if idx < len(network.tencoder):
+                lengths_t.append(xt.shape[-1])
+                tenc = network.tencoder[idx]
+                xt = tenc(xt)
+                if not tenc.empty:
+                    saved_t.append(xt)
+                else:
+                    inject = xt
+            x = encode(x, inject)
+            if idx == 0 and network.freq_emb is not None:
+                frs = torch.arange(x.shape[-2], device=x.device)
+                emb = network.freq_emb(frs).t()[None, :, :, None].expand_as(x)
+                x = x + network.freq_emb_scale * emb
+            saved.append(x)
+
+        if network.crosstransformer:
+            if network.bottom_channels:
+                f = x.shape[2]
+                x = rearrange(x, "b c f t-> b c (f t)")
+                x = network.channel_upsampler(x)
+                x = rearrange(x, "b c (f t)-> b c f t", f=f)
+                xt = network.channel_upsampler_t(xt)
+            x, xt = network.crosstransformer(x, xt)
+            if network.bottom_channels:
+                x = rearrange(x, "b c f t-> b c (f t)")
+                x = network.channel_downsampler(x)
+                x = rearrange(x, "b c (f t)-> b c f t", f=f)
+                xt = network.channel_downsampler_t(xt)
+
+        for idx, decode in enumerate(network.decoder):
+            x, pre = decode(x, saved.pop(-1), lengths.pop(-1))
+            offset = network.depth - len(network.tdecoder)
+            if idx >= offset:
+                tdec = network.tdecoder[idx - offset]
+                length_t = lengths_t.pop(-1)
+                if tdec.empty:
+                    xt, _ = tdec(pre[:, :, 0], None, length_t)
+                else:
+                    xt, _ = tdec(xt, saved_t.pop(-1), length_t)
+
+        S = len(network.sources)
+        x = x.view(B, S, -1, Fq, T)
+        x = x * std[:, None] + mean[:, None]
+        xt = xt.view(B, S, -1, length)
+        xt = xt * stdt[:, None] + meant[:, None]
+        return x, xt
+
+
+def spectral_forward(network: nn.Module, mix: torch.Tensor, run_core) -> torch.Tensor:
+    """
+    Runs an HTDemucs network on a chunk of its training length, computing the STFT,
+    the masking and the inverse STFT in PyTorch and the rest of the network with
+    `run_core`.
+
+    Args:
+        network: The HTDemucs network.
+        mix: The chunk, of shape (batch, channels, samples).
+        run_core: Runs the `HTDemucsCore` of the network on (mag, mix), e.g. in an
+            exported graph, and returns its two outputs.
+
+    Returns:
+        The separated sources, of shape (batch, sources, channels, samples).
+    """
+    z = network._spec(mix)
+    mag = network._magnitude(z).to(mix.device)
+    x, xt = run_core(mag, mix)
+    return xt + network._ispec(network._mask(z, x), mix.shape[-1])
+
+
+def _unflatten_symbolic(g, input, dim: int, unflattened_size):
+    """
+    Exports `aten::unflatten`, which `nn.MultiheadAttention` uses to split its
+    packed projections, as an ONNX Reshape. torch.onnx only has a symbolic for it
+    from torch 2.1.
+    """
+    rank = symbolic_helper._get_tensor_rank(input)
+    if rank is None:
+        return symbolic_helper._unimplemented(
+            "unflatten", "the rank of the input is unknown"
+        )
+    dim %= rank
+    input_shape = g.op("Shape", input)
+    shape = [
+        symbolic_helper._unsqueeze_helper(g, size, [0])
+        for size in symbolic_helper._unpack_list(unflattened_size)
+    ]
+    if dim > 0:
+        shape.insert(
+            0,
+            symbolic_helper._slice_helper(
+                g, input_shape, axes=[0], starts=[0], ends=[dim]
+            ),
+        )
+    if dim + 1 < rank:
+        shape.append(
+            symbolic_helper._slice_helper(
+                g, input_shape, axes=[0], starts=[dim + 1], ends=[rank]
+            )
+        )
+    return g.op("Reshape", input, g.op("Concat", *shape, axis_i=0))
+
+
+def _scaled_dot_product_attention_symbolic(
+    g, query, key, value, attn_mask, dropout_p: float, is_causal: bool
+):
+    """
+    Exports `aten::scaled_dot_product_attention`, which `nn.MultiheadAttention`
+    calls, as its MatMul and Softmax decomposition. torch.onnx only has a symbolic
+    for it from torch 2.1; this one covers the unmasked, dropout-free inference
+    calls of the Demucs transformers.
+    """
+    if not symbolic_helper._is_none(attn_mask) or is_causal or dropout_p:
+        return symbolic_helper._unimplemented(
+            "scaled_dot_product_attention", "masks and dropout are not supported"
+        )
+    rank = symbolic_helper._get_tensor_rank(key)
+    if rank is None:
+        return symbolic_helper._unimplemented(
+            "scaled_dot_product_attention", "the rank of the inputs is unknown"
+        )
+    perm = list(range(rank - 2)) + [rank - 1, rank - 2]
+    embed_dim = g.op(
+        "Gather",
+        g.op("Shape", query),
+        g.op("Constant", value_t=torch.tensor(-1)),
+        axis_i=0,
+    )
+    scale = g.op(
+        "Sqrt", g.op("Cast", embed_dim, to_i=_C_onnx.TensorProtoDataType.FLOAT)
+    )
+    scores = g.op("MatMul", query, g.op("Transpose", key, perm_i=perm))
+    scores = g.op("Div", scores, scale)
+    return g.op("MatMul", g.op("Softmax", scores, axis_i=-1), value)
+
+
+def export_demucs_network_to_onnx(
+    network: nn.Module, onnx_path: Path, chunk_shape: tuple[int, int, int]
+) -> None:
+    """
+    Exports the `HTDemucsCore` of a network to ONNX, for a single static chunk
+    shape.
+
+    The export runs on the CPU; the network is moved back to its device afterwards.
+
+    Args:
+        network: The HTDemucs network to export.
+        onnx_path: The path of the ONNX file to write.
+        chunk_shape: The (batch, channels, samples) shape of the input chunk.
+    """
+    logger.info("Exporting %s to %s", type(network).__name__, onnx_path)
+    device = next(network.parameters()).device
+    mix = torch.zeros(chunk_shape)
+    try:
+        network.cpu().eval()
+        with torch.no_grad():
+            mag = network._magnitude(network._spec(mix))
+        torch.onnx.register_custom_op_symbolic(
+            "aten::unflatten",
+            symbolic_helper.parse_args("v", "i", "v")(_unflatten_symbolic),
+            _ONNX_OPSET_VERSION,
+        )
+        torch.onnx.register_custom_op_symbolic(
+            "aten::scaled_dot_product_attention",
+            symbolic_helper.parse_args("v", "v", "v", "v", "f", "b")(
+                _scaled_dot_product_attention_symbolic
+            ),
+            _ONNX_OPSET_VERSION,
+        )
+        # Traced with autograd enabled, since under no_grad the transformer
+        # layers take the fused attention fast path, which has no ONNX symbolic
+        torch.onnx.export(
+            HTDemucsCore(network),
+            (mag, mix),
+            str(onnx_path),
+            opset_version=_ONNX_OPSET_VERSION,
+            input_names=list(_ONNX_INPUT_NAMES),
+            output_names=list(_ONNX_OUTPUT_NAMES),
+            dynamic_axes=None,
+        )
+    finally:
+        # The eager forward stays the fallback, so the weights go back where
+        # they were
+        network.to(device)
+
+
+class TensorRTForward:
+    """
+    Runs an HTDemucs network's forward pass with its `HTDemucsCore` in a serialized
+    TensorRT engine, and the STFT and inverse STFT in PyTorch.
+
+    The engine is built for the static chunk shape `apply_model` feeds the network,
+    so any other input, or an input that is not on CUDA, falls back to the eager
+    forward.
+    """
+
+    def __init__(
+        self, network: nn.Module, engine_path: Path, chunk_shape: tuple[int, int, int]
+    ):
+        import tensorrt as trt
+
+        self._network = network
+        self._forward = network.forward
+        self._chunk_shape = chunk_shape
+        runtime = trt.Runtime(trt.Logger(trt.Logger.WARNING))
+        self._engine = runtime.deserialize_cuda_engine(engine_path.read_bytes())
+        if self._engine is None:
+            raise RuntimeError(f"Could not deserialize TensorRT engine {engine_path}")
+        self._context = self._engine.create_execution_context()
+        self._output_shapes = {
+            name: tuple(self._engine.get_tensor_shape(name))
+            for name in _ONNX_OUTPUT_NAMES
+        }
+
+    def __call__(self, mix: torch.Tensor) -> torch.Tensor:
+        if not mix.is_cuda or tuple(mix.shape) != self._chunk_shape:
+            return self._forward(mix)
+        return spectral_forward(self._network, mix.float(), self._run_engine)
+
+    def _run_engine(
+        self, mag: torch.Tensor, mix: torch.Tensor
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        inputs = (mag.float().contiguous(), mix.contiguous())
+        outputs = tuple(
+            torch.empty(shape, dtype=torch.float32, device=mix.device)
+            for shape in self._output_shapes.values()
+        )
+        names = _ONNX_INPUT_NAMES + _ONNX_OUTPUT_NAMES
+        for name, tensor in zip(names, inputs + outputs):
+            self._context.set_tensor_address(name, tensor.data_ptr())
+        stream = torch.cuda.current_stream(mix.device)
+        if not self._context.execute_async_v3(stream.cuda_stream):
+            raise RuntimeError("TensorRT engine execution failed")
+        return outputs
+
+
+def build_tensorrt_engine(onnx_path: Path, engine_path: Path, precision: str) -> None:
+    """
+    Builds and serializes a TensorRT engine from an ONNX file.
+
+    Args:
+        onnx_path: The path of the ONNX file to build the engine from.
+        engine_path: The path of the engine file to write.
+        precision: "fp16" or "bf16" to let TensorRT use reduced-precision kernels,
+            or "fp32" to build a full-precision engine.
+    """
+    import tensorrt as trt
+
+    logger.info("Building TensorRT engine %s (%s)", engine_path, precision)
+    trt_logger = trt.Logger(trt.Logger.WARNING)
+    builder = trt.Builder(trt_logger)
+    network_definition = builder.create_network(
+        1 << int(trt.NetworkDefinitionCreationFlag.EXPLICIT_BATCH)
+    )
+    parser = trt.OnnxParser(network_definition, trt_logger)
+    if not parser.parse(onnx_path.read_bytes()):
+        errors = [str(parser.get_error(i)) for i in range(parser.num_errors)]
+        raise RuntimeError(f"Could not parse {onnx_path}: {'; '.join(errors)}")
+
+    builder_config = builder.create_builder_config()
+    if precision == "bf16" and hasattr(trt.BuilderFlag, "BF16"):
+        builder_config.set_flag(trt.BuilderFlag.BF16)
+    elif precision != "fp32":
+        builder_config.set_flag(trt.BuilderFlag.FP16)
+
+    serialized_engine = builder.build_serialized_network(
+        network_definition, builder_config
+    )
+    if serialized_engine is None:
+        raise RuntimeError(f"Could not build TensorRT engine from {onnx_path}")
+    engine_path.write_bytes(serialized_engine)
+
+
+def use_tensorrt_backend(model: nn.Module, model_name: str, precision: str) -> bool:
+    """
+    Replaces the forward pass of every Demucs network with a TensorRT engine.
+
+    Engines are cached on disk, keyed by (model_name, network index, chunk length,
+    precision), so the ONNX export and engine build only happen the first time.
+    If TensorRT is not installed, or the export or build fails, the networks keep
+    their PyTorch forward pass.
+
+    Args:
+        model: The Demucs model to accelerate.
+        model_name: The name of the Demucs model, used as the cache key.
+        precision: The precision of the engine, "fp32", "fp16" or "bf16".
+
+    Returns:
+        True if the TensorRT backend is in use, False otherwise.
+    """
+    cache_dir = get_backend_cache_dir("tensorrt")
+    trt_forwards = []
+    try:
+        # Fail before the export if TensorRT is missing
+        importlib.import_module("tensorrt")
+
+        for index, network in enumerate(iter_demucs_networks(model)):
+            chunk_shape = get_chunk_shape(network)
+            file_base = f"{model_name}-{index}-{chunk_shape[-1]}"
+            engine_path = cache_dir / f"{file_base}-{precision}.plan"
+            if not engine_path.exists():
+                onnx_path = cache_dir / f"{file_base}.onnx"
+                if not onnx_path.exists():
+                    export_demucs_network_to_onnx(network, onnx_path, chunk_shape)
+                build_tensorrt_engine(onnx_path, engine_path, precision)
+            trt_forwards.append(TensorRTForward(network, engine_path, chunk_shape))
+    except (ImportError, RuntimeError, ValueError) as e:
+        logger.warning("TensorRT backend unavailable, using PyTorch instead: %s", e)
+        return False
+
+    for network, trt_forward in zip(iter_demucs_networks(model), trt_forwards):
+        network.forward = trt_forward
+    logger.info("Using TensorRT engines from %s", cache_dir)
+    return True
+
+
+class OnnxRuntimeForward:
+    """
+    Runs an HTDemucs network's forward pass with its `HTDemucsCore` in an ONNX
+    Runtime CPU session, and the STFT and inverse STFT in PyTorch.
+
+    The session uses all the threads of the torch intra-op pool, a single
+    inter-op thread and every graph optimization, which fuses the convolutions
+    with their activations. The ONNX graph is exported for the static chunk shape
+    `apply_model` feeds the network, so any other input, or a CUDA input, falls
+    back to the eager forward.
+    """
+
+    def __init__(
+        self, network: nn.Module, onnx_path: Path, chunk_shape: tuple[int, int, int]
+    ):
+        import onnxruntime as ort
+
+        self._network = network
+        self._forward = network.forward
+        self._chunk_shape = chunk_shape
+        session_options = ort.SessionOptions()
+        session_options.intra_op_num_threads = torch.get_num_threads()
+        session_options.inter_op_num_threads = 1
+        session_options.graph_optimization_level = (
+            ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        session_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        self._session = ort.InferenceSession(
+            str(onnx_path),
+            sess_options=session_options,
+            providers=["CPUExecutionProvider"],
+        )
+
+    def __call__(self, mix: torch.Tensor) -> torch.Tensor:
+        if mix.is_cuda or tuple(mix.shape) != self._chunk_shape:
+            return self._forward(mix)
+        return spectral_forward(self._network, mix.float(), self._run_session)
+
+    def _run_session(
+        self, mag: torch.Tensor, mix: torch.Tensor
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        inputs = (mag.float().contiguous().numpy(), mix.contiguous().numpy())
+        outputs = self._session.run(
+            list(_ONNX_OUTPUT_NAMES), dict(zip(_ONNX_INPUT_NAMES, inputs))
+        )
+        return tuple(torch.from_numpy(output) for output in outputs)
+
+
+def use_onnxruntime_backend(model: nn.Module, model_name: str, quantize: bool) -> bool:
+    """
+    Replaces the forward pass of every Demucs network with an ONNX Runtime session.
+
+    The ONNX exports are cached on disk, keyed by (model_name, network index,
+    chunk length), and so are their dynamically quantized versions, whose matrix
+    multiplications run in INT8, so the export and quantization only happen the
+    first time. If ONNX Runtime is not installed, or the export fails, the networks
+    keep their PyTorch forward pass.
+
+    Args:
+        model: The Demucs model to accelerate.
+        model_name: The name of the Demucs model, used as the cache key.
+        quantize: Whether to run the INT8 quantized version of the ONNX graphs.
+
+    Returns:
+        True if the ONNX Runtime backend is in use, False otherwise.
+    """
+    cache_dir = get_backend_cache_dir("onnxruntime")
+    ort_forwards = []
+    try:
+        # Fail before the export if ONNX Runtime is missing
+        importlib.import_module("onnxruntime")
+
+        for index, network in enumerate(iter_demucs_networks(model)):
+            chunk_shape = get_chunk_shape(network)
+            file_base = f"{model_name}-{index}-{chunk_shape[-1]}"
+            onnx_path = cache_dir / f"{file_base}.onnx"
+            if not onnx_path.exists():
+                export_demucs_network_to_onnx(network, onnx_path, chunk_shape)
+            if quantize:
+                quantized_path = cache_dir / f"{file_base}-int8.onnx"
+                if not quantized_path.exists():
+                    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+                    logger.info("Quantizing %s to %s", onnx_path, quantized_path)
+                    # ONNX Runtime has no CPU kernel for signed INT8
+                    # convolutions, so only the transformer projections are
+                    # quantized
+                    quantize_dynamic(
+                        onnx_path,
+                        quantized_path,
+                        op_types_to_quantize=["MatMul", "Gemm"],
+                        weight_type=QuantType.QInt8,
+                    )
+                onnx_path = quantized_path
+            ort_forwards.append(OnnxRuntimeForward(network, onnx_path, chunk_shape))
+    except (ImportError, RuntimeError, ValueError) as e:
+        logger.warning("ONNX Runtime backend unavailable, using PyTorch instead: %s", e)
+        return False
+
+    for network, ort_forward in zip(iter_demucs_networks(model), ort_forwards):
+        network.forward = ort_forward
+    logger.info("Using ONNX Runtime sessions from %s", cache_dir)
+    return True
@@ -0,0 +1,116 @@
+"""
+Persistent separation server, which keeps a warmed-up audio separator resident
+across jobs, and the client used to submit jobs to it over a Unix socket.
+
+The protocol is line-based JSON: the client sends one request per line, with
+the input audio path and the output folder, and the server answers each request
+with one status line once the separation has finished.
+"""
+
+import json
+import logging
+import os
+import socket
+import socketserver
+from audio_source_separator.audio_separators import AudioSeparator
+
+logger = logging.getLogger(__name__)
+
+
+class _SeparationRequestHandler(socketserver.StreamRequestHandler):
+    """Handles the separation requests of a single client connection."""
+
+    server: "SeparationServer"
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                input_audio_path = request["input_audio_path"]
+                output_audio_folder = request["output_audio_folder"]
+            except (ValueError, KeyError, TypeError) as e:
+                self._respond({"status": "error", "message": f"Invalid request: {e}"})
+                continue
+
+            logger.info("Received request to separate %s", input_audio_path)
+            if self.server.separator.separate(input_audio_path, output_audio_folder):
+                self._respond({"status": "done"})
+            else:
+                self._respond(
+                    {
+                        "status": "error",
+                        "message": f"Separation of {input_audio_path} failed",
+                    }
+                )
+
+    def _respond(self, response: dict) -> None:
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+        self.wfile.flush()
+
+
+class SeparationServer(socketserver.UnixStreamServer):
+    """
+    Unix socket server that runs every request through the same separator, so the
+    model weights, compiled kernels and CUDA graphs stay loaded between jobs.
+    Requests are handled one at a time, as they all share the same model.
+    """
+
+    def __init__(self, socket_path: str, separator: AudioSeparator):
+        self.separator = separator
+        super().__init__(socket_path, _SeparationRequestHandler)
+
+
+def serve(separator: AudioSeparator, socket_path: str) -> None:
+    """
+    Warms up the separator and serves separation requests until interrupted.
+
+    Args:
+        separator: The audio separator to run the requests through.
+        socket_path: The path of the Unix socket to listen on. A stale socket
+            file left by a previous server is replaced.
+    """
+    separator.warm_up()
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    with SeparationServer(socket_path, separator) as server:
+        logger.info("Separation server listening on %s", socket_path)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("Separation server shutting down")
+        finally:
+            os.unlink(socket_path)
+
+
+def submit(socket_path: str, input_audio_path: str, output_audio_folder: str) -> dict:
+    """
+    Submits a separation request to a running server and waits for it to finish.
+
+    The paths are made absolute, since the server may run from another directory.
+
+    Args:
+        socket_path: The path of the Unix socket the server listens on.
+        input_audio_path: The path to the audio file to separate.
+        output_audio_folder: The folder to write the separated stems to.
+
+    Returns:
+        The response of the server, whose "status" is "done" or "error".
+
+    Raises:
+        OSError: If the server cannot be reached.
+    """
+    request = {
+        "input_audio_path": os.path.abspath(input_audio_path),
+        "output_audio_folder": os.path.abspath(output_audio_folder),
+    }
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client_socket:
+        client_socket.connect(socket_path)
+        with client_socket.makefile("rwb") as stream:
+            stream.write(json.dumps(request).encode() + b"\n")
+            stream.flush()
+            response = stream.readline()
+
+    if not response:
+        raise ConnectionError(f"Server at {socket_path} closed the connection")
+    return json.loads(response)
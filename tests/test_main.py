@@ -0,0 +1,21 @@
+"""Tests for the command line input handling."""
+
+from audio_source_separator.main import _collect_input_files
+
+
+def test_collect_input_files_filters_folder_entries(tmp_path):
+    for name in ["b.mp3", "a.WAV", "c.flac", "cover.jpg", ".hidden.wav", "notes"]:
+        (tmp_path / name).write_bytes(b"")
+    (tmp_path / "nested.wav").mkdir()
+
+    assert _collect_input_files([str(tmp_path)]) == [
+        str(tmp_path / name) for name in ["a.WAV", "b.mp3", "c.flac"]
+    ]
+
+
+def test_collect_input_files_keeps_explicit_files(tmp_path):
+    explicit = tmp_path / "track.unknown"
+    explicit.write_bytes(b"")
+    missing = str(tmp_path / "missing.mp3")
+
+    assert _collect_input_files([str(explicit), missing]) == [str(explicit), missing]
@@ -0,0 +1,67 @@
+"""Tests for the line-based JSON protocol of the separation server."""
+
+import json
+import socket
+import threading
+from types import SimpleNamespace
+
+from audio_source_separator.server import _SeparationRequestHandler
+
+
+class _StubSeparator:
+    """Separator that succeeds for every path except "bad.wav"."""
+
+    def __init__(self):
+        self.calls = []
+
+    def separate(self, input_audio_path: str, output_audio_folder: str) -> bool:
+        self.calls.append((input_audio_path, output_audio_folder))
+        return input_audio_path != "bad.wav"
+
+
+def _exchange(separator, request_lines: list[bytes]) -> list[dict]:
+    """Runs the handler on one end of a socket pair and sends it the requests."""
+    server_socket, client_socket = socket.socketpair()
+    server = SimpleNamespace(separator=separator)
+
+    def handle():
+        # Closing the socket afterwards, as the socket server does, ends the
+        # client's stream of responses
+        with server_socket:
+            _SeparationRequestHandler(server_socket, None, server)
+
+    handler_thread = threading.Thread(target=handle)
+    handler_thread.start()
+    with client_socket, client_socket.makefile("rwb") as stream:
+        stream.write(b"".join(request_lines))
+        stream.flush()
+        client_socket.shutdown(socket.SHUT_WR)
+        responses = [json.loads(line) for line in stream]
+    handler_thread.join(timeout=5)
+    return responses
+
+
+def _request(input_audio_path: str) -> bytes:
+    request = {"input_audio_path": input_audio_path, "output_audio_folder": "out"}
+    return json.dumps(request).encode() + b"\n"
+
+
+def test_server_reports_done_and_error_per_request():
+    separator = _StubSeparator()
+    responses = _exchange(separator, [_request("good.wav"), _request("bad.wav")])
+
+    assert responses[0] == {"status": "done"}
+    assert responses[1]["status"] == "error"
+    assert "bad.wav" in responses[1]["message"]
+    assert separator.calls == [("good.wav", "out"), ("bad.wav", "out")]
+
+
+def test_server_rejects_invalid_requests_and_keeps_serving():
+    separator = _StubSeparator()
+    responses = _exchange(
+        separator, [b"not json\n", b'{"input_audio_path": "x"}\n', _request("a.wav")]
+    )
+
+    assert [response["status"] for response in responses] == ["error", "error", "done"]
+    assert responses[0]["message"].startswith("Invalid request")
+    assert separator.calls == [("a.wav", "out")]
@@ -0,0 +1,47 @@
+"""Tests for the WAV stem writer helpers, which need no model."""
+
+import os
+import wave
+
+import numpy as np
+import pytest
+
+from audio_source_separator.audio_separators import _wav_header, _write_all
+
+
+def test_wav_header_round_trips_through_wave(tmp_path):
+    samples = np.arange(-50, 50, dtype=np.int16).reshape(50, 2)
+    path = tmp_path / "stem.wav"
+    path.write_bytes(_wav_header(2, 44100, 50) + samples.tobytes())
+
+    with wave.open(str(path), "rb") as wav_file:
+        assert wav_file.getnchannels() == 2
+        assert wav_file.getsampwidth() == 2
+        assert wav_file.getframerate() == 44100
+        assert wav_file.getnframes() == 50
+        frames = wav_file.readframes(50)
+    assert np.frombuffer(frames, dtype=np.int16).reshape(50, 2).tolist() == (
+        samples.tolist()
+    )
+
+
+@pytest.mark.skipif(not hasattr(os, "writev"), reason="os.writev is unavailable")
+@pytest.mark.parametrize("max_bytes", [1, 3, 7, 44, 45])
+def test_write_all_resumes_after_short_writes(tmp_path, monkeypatch, max_bytes):
+    real_writev = os.writev
+
+    def short_writev(fd, buffers):
+        # Writes at most max_bytes, possibly stopping inside a buffer
+        pending = b"".join(bytes(buffer) for buffer in buffers)[:max_bytes]
+        return real_writev(fd, [pending])
+
+    monkeypatch.setattr(os, "writev", short_writev)
+    buffers = [b"header-bytes", np.arange(20, dtype=np.int16), b"", b"tail"]
+    path = tmp_path / "out.bin"
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+    try:
+        _write_all(fd, buffers)
+    finally:
+        os.close(fd)
+
+    assert path.read_bytes() == b"".join(bytes(memoryview(b)) for b in buffers)